@@ -1,16 +1,28 @@
-from flask import Flask, request, jsonify
-from pymongo import MongoClient
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from handlers.email_handler import EmailManager
+from handlers.email_dispatcher import EmailDispatcher
+from handlers.notification_outbox import NotificationOutbox
 from handlers.weather_handler import WeatherHandler
-from web_scaper.PanahonScraper import PanahonScraperPlaywright as PanahonScraper
+from handlers.trail_buffer import TrailWriteBuffer, BufferFull
+from handlers.geofence_engine import GeofenceEngine, MemoryMembership, MongoMembership
+from handlers.cooldown_store import build_cooldown_store
+from handlers.scrape_jobs import ScrapeJobManager
+from handlers.geo_queries import (trail_query, shapes_query, nearby_fences_query, parse_after, parse_flag,
+                                  stream_ndjson, TRAIL_PROJECTION, SHAPE_PROJECTION)
+from handlers import metrics
+from handlers.mongo_handler import get_client, get_database, close_client, ensure_indexes, parse_timestamp
+from datetime import datetime, timezone
 from threading import Thread
-from datetime import datetime, timedelta, timezone
 import traceback
+import time
+import json
 import os
 
+# Start of the startup-time budget, measured until create_app() returns
+PROCESS_STARTED = time.monotonic()
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -18,23 +30,186 @@ weather_info = WeatherHandler()
 
 CORS(app)  # Enable CORS for browser requests
 
-# Fixed MongoDB connection with TLS certificate validation bypass
-try:
-    client = MongoClient(
-        os.getenv("MONGODB_URI"),
-        tlsAllowInvalidCertificates=True
+# Scrapes run on their own executor; request threads wait at most
+# WEATHER_ALERTS_SYNC_WAIT seconds and otherwise hand back a job id.
+# Jobs are mirrored to MongoDB so any server worker can answer a poll.
+scrape_jobs = ScrapeJobManager(
+    # Raises when the scrape fails, so the job reports "failed" rather than an empty advisory
+    weather_info.load_panahon_advisory,
+    workers=int(os.getenv("SCRAPE_JOB_WORKERS", 2)),
+    job_ttl=int(os.getenv("SCRAPE_JOB_TTL", 600)),
+    collection_factory=lambda: get_database()[os.getenv("SCRAPE_JOBS", "scrape_jobs")]
+)
+WEATHER_ALERTS_SYNC_WAIT = float(os.getenv("WEATHER_ALERTS_SYNC_WAIT", 3))
+
+# Email cooldowns per (user, fence), warmed from recent alerts so a restart
+# doesn't resend; set COOLDOWN_REDIS_URL to share them between processes
+cooldown_store = build_cooldown_store()
+
+# Alert emails: bounded queue, fixed sender threads, one shared Brevo client,
+# and alerts for the same recipient within the window merged into one digest
+email_dispatcher = EmailDispatcher(
+    workers=int(os.getenv("EMAIL_WORKERS", 2)),
+    max_queue=int(os.getenv("EMAIL_QUEUE_MAX", 1000)),
+    coalesce_window=float(os.getenv("EMAIL_COALESCE_SECONDS", 30)),
+    rate_per_second=float(os.getenv("EMAIL_RATE_PER_SECOND", 2)),
+    burst=int(os.getenv("EMAIL_BURST", 5))
+)
+
+TRAIL_ENQUEUE_TIMEOUT = float(os.getenv("TRAIL_ENQUEUE_TIMEOUT", 2.0))
+
+# Page size of the NDJSON read endpoints (?limit=, capped at the max)
+GEO_QUERY_DEFAULT_LIMIT = int(os.getenv("GEO_QUERY_DEFAULT_LIMIT", 1000))
+GEO_QUERY_MAX_LIMIT = int(os.getenv("GEO_QUERY_MAX_LIMIT", 5000))
+
+# Server-side geofencing of tracked points (GEOFENCE_ENGINE=0 to disable).
+# Who is inside which fence is shared through MongoDB so several server
+# workers don't each report the same enter; GEOFENCE_SHARED_MEMBERSHIP=0
+# keeps it in memory, which is only correct with a single worker.
+GEOFENCE_ENABLED = os.getenv("GEOFENCE_ENGINE", "1") != "0"
+GEOFENCE_SHARED_MEMBERSHIP = os.getenv("GEOFENCE_SHARED_MEMBERSHIP", "1") != "0"
+
+# MongoDB and everything bound to it are per process and set up by
+# create_app(), after the server has forked its workers
+client = None
+geo_db = None
+user_trail = None
+event_log = None
+drawn_shapes = None
+notification_outbox = None
+trail_buffer = None
+geofence_engine = None
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 2.0))
+startup_state = {'startup_seconds': None, 'warmed_up': False, 'warm_up_seconds': None}
+
+
+def create_app():
+    """
+    App factory: set up MongoDB handles and the per-process services.
+    Called once in every server worker (see gunicorn.conf.py) and by
+    `python app.py`. Nothing here waits on the network: the MongoClient
+    connects on first use and the database warm-up runs in the background,
+    so the worker starts serving (and /health/live answers) right away.
+    """
+    global client, geo_db, user_trail, event_log, drawn_shapes
+    global notification_outbox, trail_buffer, geofence_engine
+
+    if client is not None:
+        return app
+
+    client = get_client()
+    geo_db = get_database()
+    user_trail = geo_db[os.getenv("MONGODB_COLLECTION")]
+    event_log = geo_db[os.getenv("EVENT_LOG")]
+    drawn_shapes = geo_db.shapes
+
+    # Durable delivery: pending notifications live on event_log documents and a
+    # background drainer claims them in batches and retries with backoff
+    notification_outbox = NotificationOutbox(
+        event_log,
+        email_dispatcher,
+        batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", 50)),
+        poll_interval=float(os.getenv("OUTBOX_POLL_SECONDS", 2)),
+        max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+    )
+
+    # Batched trail ingestion: points are flushed with insert_many by size or time
+    trail_buffer = TrailWriteBuffer(
+        user_trail,
+        batch_size=int(os.getenv("TRAIL_BATCH_SIZE", 500)),
+        flush_interval=float(os.getenv("TRAIL_FLUSH_SECONDS", 1.0)),
+        max_pending=int(os.getenv("TRAIL_BUFFER_MAX", 10000))
+    )
+
+    geofence_engine = GeofenceEngine(
+        drawn_shapes,
+        geo_db.fence_meta,
+        cell_deg=float(os.getenv("GEOFENCE_CELL_DEG", 0.05)),
+        poll_interval=float(os.getenv("GEOFENCE_POLL_SECONDS", 5)),
+        reload_interval=float(os.getenv("GEOFENCE_RELOAD_SECONDS", 300)),
+        membership=MongoMembership(geo_db.fence_membership) if GEOFENCE_SHARED_MEMBERSHIP else MemoryMembership()
     )
-    # Test the connection
-    client.admin.command('ping')
-    print("✓ MongoDB connection successful!")
-except Exception as e:
-    print(f"✗ MongoDB connection failed: {e}")
-    raise
 
-geo_db = client[os.getenv("MONGODB_DATABASE")]
-user_trail = geo_db[os.getenv("MONGODB_COLLECTION")]
-event_log = geo_db[os.getenv("EVENT_LOG")]
-drawn_shapes = geo_db.shapes
+    # Under gunicorn every worker publishes its metrics to METRICS_DIR and
+    # /metrics sums them (see gunicorn.conf.py); unset, /metrics is per process
+    metrics.share(os.getenv("METRICS_DIR"), interval=float(os.getenv("METRICS_PUBLISH_SECONDS", 5)))
+
+    Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    startup_state['startup_seconds'] = time.monotonic() - PROCESS_STARTED
+    if startup_state['startup_seconds'] > STARTUP_BUDGET_SECONDS:
+        print(f"⚠️ Startup took {startup_state['startup_seconds']:.2f}s, "
+              f"over the {STARTUP_BUDGET_SECONDS:.2f}s budget")
+    else:
+        print(f"✓ App ready to serve in {startup_state['startup_seconds']:.2f}s")
+    return app
+
+
+def warm_up():
+    """Database-bound start-up work, off the serving path; /health/ready waits for it"""
+    started = time.monotonic()
+    try:
+        client.admin.command('ping')
+        print("✓ MongoDB connection successful!")
+    except Exception as e:
+        # Not fatal: requests keep retrying the connection on their own
+        print(f"✗ MongoDB connection failed: {e}")
+
+    try:
+        ensure_indexes(geo_db)
+    except Exception as e:
+        print(f"✗ Could not ensure MongoDB indexes: {e}")
+
+    try:
+        cooldown_store.warm(event_log, int(os.getenv("EMAIL_COOLDOWN_MINUTES", 5)))
+    except Exception as e:
+        print(f"✗ Could not warm cooldown store: {e}")
+
+    notification_outbox.start()
+    if GEOFENCE_ENABLED:
+        try:
+            geofence_engine.start()
+        except Exception as e:
+            print(f"✗ Could not load geofences: {e}")
+
+    startup_state['warm_up_seconds'] = time.monotonic() - started
+    startup_state['warmed_up'] = True
+
+
+def shutdown_app():
+    """Drain buffered work and close MongoDB; called when a worker exits"""
+    if trail_buffer is not None:
+        trail_buffer.close()
+    if notification_outbox is not None:
+        notification_outbox.stop()
+    email_dispatcher.close()
+    if geofence_engine is not None:
+        geofence_engine.stop()
+    metrics.stop_sharing()
+    close_client()
+
+
+@app.before_request
+def start_trace():
+    # Honour an upstream request id so logs line up across services
+    metrics.new_trace_id(request.headers.get('X-Request-ID'))
+    request.environ['metrics.started'] = time.perf_counter()
+
+
+@app.after_request
+def finish_trace(response):
+    started = request.environ.get('metrics.started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        # The route pattern, not the path, so ids don't explode the label set
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint,
+                                             status=response.status_code)
+        metrics.log_event("http_request", method=request.method, endpoint=endpoint,
+                          status=response.status_code, seconds=round(elapsed, 4))
+    response.headers['X-Trace-Id'] = metrics.current_trace_id() or ""
+    return response
 
 
 @app.route('/', methods=['GET'])
@@ -44,19 +219,59 @@ def home():
         "status": "running",
         "endpoints": [
             "/save-tracking (POST)",
+            "/save-tracking/batch (POST)",
             "/log-alert-event (POST)",
             "/get-weather-alerts (GET)",
-            "/health (GET)"
+            "/weather-alerts/jobs (POST)",
+            "/weather-alerts/jobs/<job_id> (GET)",
+            "/weather-alerts/jobs/<job_id>/stream (GET)",
+            "/trail/<user_id> (GET)",
+            "/shapes (GET)",
+            "/fences/nearby (GET)",
+            "/health (GET)",
+            "/health/live (GET)",
+            "/health/ready (GET)",
+            "/metrics (GET)"
         ]
     })
 
 
+def format_weather_alerts(location, weather_data):
+    return {
+        "success": True,
+        "location": location,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "alerts": {
+            "rainfall": weather_data.get('Rainfall'),
+            "thunderstorm": weather_data.get('Thunderstorm'),
+            "flood": weather_data.get('Flood'),
+            "tropical": weather_data.get('Tropical')
+        }
+    }
+
+
+def job_response(job):
+    """Status body for a scrape job, with the formatted alerts once it is done"""
+    body = job.to_dict()
+    body["success"] = job.status != "failed"
+    body["status_url"] = f"/weather-alerts/jobs/{job.job_id}"
+    body["stream_url"] = f"/weather-alerts/jobs/{job.job_id}/stream"
+    if job.status == "done":
+        body.update(format_weather_alerts(job.location, job.result))
+    return body
+
+
 @app.route('/get-weather-alerts', methods=['GET'])
 def get_weather_alerts():
     """
     GET endpoint to scrape weather alerts from Panahon.gov.ph
     Query parameter: location (required)
+    Query parameter: async (optional) - return a job id right away instead of waiting
     Example: /get-weather-alerts?location=Naga
+
+    Cached results are returned at once. Otherwise the scrape runs as a job and
+    the request waits at most WEATHER_ALERTS_SYNC_WAIT seconds; if it isn't
+    done by then the response is 202 with the job to poll.
     """
     try:
         # Get location from query parameters
@@ -70,26 +285,18 @@ def get_weather_alerts():
 
         print(f"🌤️ Fetching weather alerts for: {location}")
 
-        # Initialize scraper and get data
-        scraper = PanahonScraper()
-        scraper.start_scraping(location)
-        weather_data = scraper.get_data()
-
-        # Format response
-        response = {
-            "success": True,
-            "location": location,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "alerts": {
-                "rainfall": weather_data.get('Rainfall'),
-                "thunderstorm": weather_data.get('Thunderstorm'),
-                "flood": weather_data.get('Flood'),
-                "tropical": weather_data.get('Tropical')
-            }
-        }
+        weather_data = weather_info.get_cached_panahon_advisory(location)
+        if weather_data is None:
+            job = scrape_jobs.submit(location)
+            wait = 0 if request.args.get('async') in ("1", "true") else WEATHER_ALERTS_SYNC_WAIT
+            if not job.done.wait(wait):
+                return jsonify(job_response(job)), 202
+            if job.status == "failed":
+                raise RuntimeError(job.error)
+            weather_data = job.result
 
         print(f"✅ Weather data retrieved successfully for {location}")
-        return jsonify(response), 200
+        return jsonify(format_weather_alerts(location, weather_data)), 200
 
     except Exception as e:
         print(f"❌ Error fetching weather alerts: {e}")
@@ -100,56 +307,189 @@ def get_weather_alerts():
         }), 500
 
 
+@app.route('/weather-alerts/jobs', methods=['POST'])
+def submit_weather_alerts_job():
+    """
+    Start a weather alert lookup in the background.
+    Body: {"location": "Naga"} (or ?location=Naga)
+    Jobs for a location that is already being scraped are shared.
+    """
+    data = request.get_json(silent=True) or {}
+    location = data.get('location') or request.args.get('location')
+    if not location:
+        return jsonify({"success": False, "error": "Location parameter is required"}), 400
+
+    job = scrape_jobs.submit(location)
+    return jsonify(job_response(job)), 202
+
+
+@app.route('/weather-alerts/jobs/<job_id>', methods=['GET'])
+def get_weather_alerts_job(job_id):
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+    return jsonify(job_response(job)), 200
+
+
+@app.route('/weather-alerts/jobs/<job_id>/stream', methods=['GET'])
+def stream_weather_alerts_job(job_id):
+    """Server-sent events: a status event now, heartbeats while running, then the result"""
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+
+    def events():
+        yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+        while not scrape_jobs.wait(job, 15):
+            yield ": heartbeat\n\n"
+        yield f"event: result\ndata: {json.dumps(job_response(job), default=str)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.route('/save-tracking', methods=['POST'])
 def save_tracking():
     data = request.json
     document = {
         "type": data['type'],
         "properties": data['properties'],
-        "geometry": data['geometry']
+        "geometry": data['geometry'],
+        # Server time, drives the optional TRAIL_RETENTION_DAYS TTL index
+        "created_at": datetime.now(timezone.utc)
     }
     result = user_trail.insert_one(document)
+    evaluate_geofences([document])
     return jsonify({"success": True, "id": str(result.inserted_id)})
 
 
-def send_email_async(fence_name, user_id):
-    """Send email in background thread"""
-    try:
-        email_manager = EmailManager()
-        email_manager.create_message(
-            f"Alert: User {user_id} has entered the geofence '{fence_name}'.\n\n"
-            f"Time: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC\n"
-            f"Fence: {fence_name}"
-        )
-
-        success = email_manager.send_alert_email()
-        if success:
-            print(f"✓ Email sent successfully for fence '{fence_name}'")
-        else:
-            print(f"✗ Email failed to send for fence '{fence_name}'")
+def point_user_id(properties):
+    return properties.get('userId') or properties.get('user_id')
+
 
+def evaluate_geofences(documents):
+    """Run tracked points through the geofence engine and record enter/exit events"""
+    if not GEOFENCE_ENABLED:
+        return
+    try:
+        geofence_engine.start()
+
+        # Keep each user's points in arrival order
+        points_by_user = {}
+        for document in documents:
+            properties = document.get('properties') or {}
+            geometry = document.get('geometry') or {}
+            user_id = point_user_id(properties)
+            coordinates = geometry.get('coordinates') or []
+            if not user_id or geometry.get('type') != "Point" or len(coordinates) < 2:
+                continue
+            points_by_user.setdefault(user_id, []).append((
+                coordinates[0],
+                coordinates[1],
+                properties.get('timestamp') or datetime.now(timezone.utc).isoformat()
+            ))
+
+        for user_id, points in points_by_user.items():
+            for event in geofence_engine.evaluate(user_id, points):
+                if event['event'] == 'enter':
+                    record_alert_event(event['user_id'], event['fence_name'], event['time_stamp'], source="server")
+                else:
+                    record_exit_event(event['user_id'], event['fence_name'], event['time_stamp'])
     except Exception as e:
-        print(f"✗ Email sending failed: {e}")
+        print(f"Error evaluating geofences: {e}")
         traceback.print_exc()
 
 
+def trail_document(feature):
+    """Trail document for one GeoJSON point feature, or None if it is malformed"""
+    if not isinstance(feature, dict):
+        return None
+    if 'type' not in feature or 'properties' not in feature or 'geometry' not in feature:
+        return None
+    return {
+        "type": feature['type'],
+        "properties": feature['properties'],
+        "geometry": feature['geometry'],
+        "created_at": datetime.now(timezone.utc)
+    }
+
+
+def iter_ndjson_features(stream):
+    """Yield parsed features from an NDJSON request body without reading it all at once"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@app.route('/save-tracking/batch', methods=['POST'])
+def save_tracking_batch():
+    """
+    Batch trail ingestion.
+    Body: a GeoJSON FeatureCollection, or NDJSON (one Feature per line) with
+    Content-Type application/x-ndjson. Points are buffered and written with
+    insert_many; when the buffer is full the response is 503 with Retry-After.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        features = iter_ndjson_features(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not data or data.get('type') != "FeatureCollection" or not isinstance(data.get('features'), list):
+            return jsonify({
+                "success": False,
+                "error": "Expected a GeoJSON FeatureCollection or an NDJSON body"
+            }), 400
+        features = data['features']
+
+    accepted = 0
+    rejected = 0
+    try:
+        for chunk in chunked(features, 500):
+            documents = []
+            for feature in chunk:
+                document = trail_document(feature)
+                if document is None:
+                    rejected += 1
+                else:
+                    documents.append(document)
+            accepted += trail_buffer.add_many(documents, timeout=TRAIL_ENQUEUE_TIMEOUT)
+            evaluate_geofences(documents)
+    except BufferFull as e:
+        accepted += e.accepted
+        response = jsonify({
+            "success": False,
+            "error": "Trail buffer is full, retry the remaining points later",
+            "accepted": accepted,
+            "rejected": rejected
+        })
+        response.headers['Retry-After'] = "1"
+        return response, 503
+
+    return jsonify({"success": True, "accepted": accepted, "rejected": rejected}), 202
+
+
 def should_send_email(user_id, fence_name, cooldown_minutes=5):
     """
     Check if we should send an email based on cooldown period.
     Prevents spam if user enters same fence multiple times quickly.
+    Answered from the cooldown store, so no database query on the request path.
     """
     try:
-        # Look for recent alerts from this user in this fence
-        cooldown_time = datetime.now(timezone.utc) - timedelta(minutes=cooldown_minutes)
-
-        recent_alert = event_log.find_one({
-            "user_id": user_id,
-            "fence_name": fence_name,
-            "time_stamp": {"$gte": cooldown_time.isoformat()}
-        })
-
-        # If no recent alert found, we should send email
-        return recent_alert is None
+        return cooldown_store.should_send(user_id, fence_name, cooldown_minutes)
 
     except Exception as e:
         print(f"Error checking cooldown: {e}")
@@ -157,6 +497,55 @@ def should_send_email(user_id, fence_name, cooldown_minutes=5):
         return True
 
 
+def record_alert_event(user_id, fence_name, timestamp, source="client"):
+    """
+    Log a fence entry. Unless the cooldown is active, the same insert also
+    records a pending notification that the outbox drainer delivers.
+    """
+    print(f"📍 Alert received: user={user_id}, fence={fence_name}, source={source}")
+
+    # Get cooldown setting (set to 0 to disable for testing)
+    cooldown_minutes = int(os.getenv("EMAIL_COOLDOWN_MINUTES", 5))
+
+    # Check if we should send email (cooldown check)
+    send_email = cooldown_minutes == 0 or should_send_email(user_id, fence_name, cooldown_minutes)
+
+    # One write: the alert and, if needed, its pending notification
+    document = {
+        "user_id": user_id,
+        "time_stamp": parse_timestamp(timestamp),
+        "fence_name": fence_name
+    }
+    if source != "client":
+        document["source"] = source
+    if send_email:
+        document["notification"] = NotificationOutbox.pending_notification()
+    result = event_log.insert_one(document)
+
+    if send_email:
+        notification_outbox.start()
+        notification_outbox.notify()
+        message = "Alert logged, email queued"
+        print(f"📧 Queued email for {user_id} in {fence_name}")
+    else:
+        message = "Alert logged, email skipped (cooldown active)"
+        print(f"⏸ Email skipped for {user_id} in {fence_name} (cooldown)")
+
+    return result.inserted_id, message
+
+
+def record_exit_event(user_id, fence_name, timestamp):
+    """Log a fence exit seen by the server; exits never notify"""
+    print(f"🚪 {user_id} left fence {fence_name}")
+    event_log.insert_one({
+        "user_id": user_id,
+        "time_stamp": parse_timestamp(timestamp),
+        "fence_name": fence_name,
+        "event": "exit",
+        "source": "server"
+    })
+
+
 @app.route('/log-alert-event', methods=['POST'])
 def log_alert_event():
     try:
@@ -168,40 +557,15 @@ def log_alert_event():
 
         user_id = data['userId']
         fence_name = data['fenceName']
-        timestamp = data.get('timestamp', datetime.now(timezone.utc).isoformat())
-
-        print(f"📍 Alert received: user={user_id}, fence={fence_name}")
+        # Stored as a BSON date; a missing or unparsable client timestamp means now
+        timestamp = parse_timestamp(data.get('timestamp'))
 
-        # Save to database first
-        document = {
-            "user_id": user_id,
-            "time_stamp": timestamp,
-            "fence_name": fence_name
-        }
-        result = event_log.insert_one(document)
-
-        # Get cooldown setting (set to 0 to disable for testing)
-        cooldown_minutes = int(os.getenv("EMAIL_COOLDOWN_MINUTES", 5))
-
-        # Check if we should send email (cooldown check)
-        if cooldown_minutes == 0 or should_send_email(user_id, fence_name, cooldown_minutes):
-            # Send email in background thread (non-blocking)
-            email_thread = Thread(
-                target=send_email_async,
-                args=(fence_name, user_id),
-                daemon=True  # Thread will close when main program exits
-            )
-            email_thread.start()
-            message = "Alert logged, email being sent"
-            print(f"📧 Starting email thread for {user_id} in {fence_name}")
-        else:
-            message = "Alert logged, email skipped (cooldown active)"
-            print(f"⏸ Email skipped for {user_id} in {fence_name} (cooldown)")
+        inserted_id, message = record_alert_event(user_id, fence_name, timestamp)
 
         # Return immediately without waiting for email
         return jsonify({
             "success": True,
-            "id": str(result.inserted_id),
+            "id": str(inserted_id),
             "message": message
         }), 200
 
@@ -211,15 +575,99 @@ def log_alert_event():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def page_limit():
+    limit = request.args.get('limit', GEO_QUERY_DEFAULT_LIMIT, type=int)
+    return max(1, min(limit, GEO_QUERY_MAX_LIMIT))
+
+
+def ndjson_response(collection, query, projection):
+    """Stream one page of a query as NDJSON; see stream_ndjson for the paging line"""
+    lines = stream_ndjson(collection, query, projection,
+                          after=parse_after(request.args.get('after')), limit=page_limit())
+    return Response(lines, mimetype="application/x-ndjson")
+
+
+@app.route('/trail/<user_id>', methods=['GET'])
+def get_trail(user_id):
+    """
+    Trail points of one user as NDJSON, oldest first.
+    Query: start, end (ISO times, on the server receive time), bbox, limit, after
+    """
+    try:
+        query = trail_query(user_id, request.args.get('start'), request.args.get('end'),
+                            request.args.get('bbox'))
+        return ndjson_response(user_trail, query, TRAIL_PROJECTION)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route('/shapes', methods=['GET'])
+def get_shapes():
+    """
+    Shapes intersecting a bounding box as NDJSON.
+    Query: bbox (required), active (1/true or 0/false, optional), limit, after
+    """
+    bbox = request.args.get('bbox')
+    if not bbox:
+        return jsonify({"success": False, "error": "bbox parameter is required"}), 400
+    try:
+        query = shapes_query(bbox, parse_flag("active", request.args.get('active')))
+        return ndjson_response(drawn_shapes, query, SHAPE_PROJECTION)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route('/fences/nearby', methods=['GET'])
+def get_nearby_fences():
+    """
+    Active fences within `radius` metres (default 1000) of a point, as NDJSON.
+    Query: lng, lat (required), radius, limit, after
+    """
+    lng = request.args.get('lng', type=float)
+    lat = request.args.get('lat', type=float)
+    if lng is None or lat is None:
+        return jsonify({"success": False, "error": "lng and lat parameters are required"}), 400
+    try:
+        query = nearby_fences_query(lng, lat, request.args.get('radius', 1000.0, type=float))
+        return ndjson_response(drawn_shapes, query, SHAPE_PROJECTION)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape target: totals of every server worker when METRICS_DIR is shared"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: the process is up and serving; never touches dependencies"""
+    return jsonify({
+        "status": "alive",
+        "startup_seconds": startup_state['startup_seconds'],
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }), 200
+
+
+@app.route('/health/ready', methods=['GET'])
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint for Railway"""
+    """Readiness (and the Railway health check): warm-up finished and MongoDB answers"""
     try:
+        if not startup_state['warmed_up']:
+            return jsonify({
+                "status": "starting",
+                "startup_seconds": startup_state['startup_seconds']
+            }), 503
+
         # Test MongoDB connection
         client.admin.command('ping')
         return jsonify({
             "status": "healthy",
             "database": "connected",
+            "startup_seconds": startup_state['startup_seconds'],
+            "warm_up_seconds": startup_state['warm_up_seconds'],
             "timestamp": datetime.now(timezone.utc).isoformat()
         }), 200
     except Exception as e:
@@ -230,12 +678,13 @@ def health():
 
 
 if __name__ == '__main__':
+    # Development server; production runs gunicorn with gunicorn.conf.py
     try:
+        create_app()
         # Use 0.0.0.0 to allow external connections (required for Railway)
         # Railway provides PORT env variable
         port = int(os.getenv("PORT", 5000))
-        app.run(host="0.0.0.0", port=port)
+        app.run(host="0.0.0.0", port=port, threaded=True)
     finally:
-        # Ensure the MongoDB connection is closed properly
-        client.close()
-        print("MongoDB connection closed")
\ No newline at end of file
+        # Flush buffers and ensure the MongoDB connection is closed properly
+        shutdown_app()
@@ -0,0 +1,72 @@
+"""Closed-loop load generator and latency summary"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import math
+import time
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'scenario': name,
+        'requests': count + errors,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if count else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if count else None,
+        'mean_ms': round(sum(latencies) / count * 1000, 2) if count else None,
+        'throughput_rps': round(count / elapsed, 1) if elapsed > 0 else None,
+        'seconds': round(elapsed, 2)
+    }
+
+
+def run_load(name, make_client, operation, requests, concurrency):
+    """
+    Send `requests` operations from `concurrency` threads, each with its own
+    client from make_client(). operation(client, i) returns True on success.
+    """
+    latencies = []
+    errors = [0]
+    lock = Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = make_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                ok = operation(client, i)
+            except Exception as e:
+                print(f"  {name}: request {i} raised {e}")
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"load-{name}") as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(name, latencies, errors[0], time.perf_counter() - started)
+
+
+def print_table(results):
+    columns = ['scenario', 'requests', 'errors', 'p50_ms', 'p99_ms', 'mean_ms', 'throughput_rps', 'seconds']
+    widths = {column: max(len(column), *(len(str(result.get(column))) for result in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for result in results:
+        print("  ".join(str(result.get(column)).ljust(widths[column]) for column in columns))
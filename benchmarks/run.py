@@ -0,0 +1,238 @@
+"""
+Offline benchmark suite.
+
+Every upstream is replaced by a local stand-in: Playwright loads
+benchmarks/fixtures/panahon.html from a local server, WeatherAPI is a fake
+HTTP server and emails go to an in-process sink. MongoDB has to be a local
+mongod (e.g. `docker run -p 27017:27017 mongo`); the suite works in a
+throwaway database and drops it afterwards. Chromium must be installed once
+with `playwright install chromium`; after that nothing touches the network.
+
+    python -m benchmarks.run                      # every scenario
+    python -m benchmarks.run --scenario save-tracking --requests 5000 --concurrency 32
+    python -m benchmarks.run --scenario worker-pass --fences 5000 --passes 3
+
+Scenarios: save-tracking, log-alert-event, get-weather-alerts, worker-pass.
+Each reports p50/p99/mean latency and throughput; worker-pass reports per
+pass latency and fences evaluated per second.
+"""
+from benchmarks.stubs import (start_fixture_server, start_weatherapi_server, EmailSink, PROVINCES)
+from benchmarks.load import run_load, summarize, print_table
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import random
+import time
+
+SCENARIOS = ['save-tracking', 'log-alert-event', 'get-weather-alerts', 'worker-pass']
+
+# Roughly the Philippines, where the synthetic fences are spread
+LAT_RANGE = (5.0, 19.0)
+LNG_RANGE = (117.0, 127.0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the geofencing API and worker")
+    parser.add_argument("--scenario", choices=SCENARIOS + ['all'], default='all')
+    parser.add_argument("--requests", type=int, default=2000, help="requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fences", type=int, default=1000, help="synthetic fences to seed")
+    parser.add_argument("--passes", type=int, default=3, help="worker passes to time")
+    parser.add_argument("--users", type=int, default=200, help="distinct tracked users")
+    parser.add_argument("--locations", type=int, default=8, help="distinct locations for weather alerts")
+    parser.add_argument("--weather-requests", type=int, default=200, help="requests for get-weather-alerts")
+    parser.add_argument("--weatherapi-latency-ms", type=float, default=20)
+    parser.add_argument("--popup-delay-ms", type=int, default=300)
+    parser.add_argument("--email-latency-ms", type=float, default=50)
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--keep-db", action="store_true", help="don't drop the benchmark database")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Point the app at the stand-ins; must run before app or worker is imported"""
+    fixture_server, fixture_url = start_fixture_server()
+    weather_server, weather_url = start_weatherapi_server(latency=args.weatherapi_latency_ms / 1000)
+    EmailSink.latency = args.email_latency_ms / 1000
+
+    database = f"bench_{int(time.time())}"
+    os.environ.update({
+        "PANAHON_URL": f"{fixture_url}/panahon.html?delay={args.popup_delay_ms}",
+        "WEATHERAPI_BASE_URL": weather_url,
+        "WEATHER_API": "bench",
+        "MONGODB_URI": args.mongo_uri,
+        "MONGODB_DATABASE": database,
+        "MONGODB_COLLECTION": "user_trail",
+        "EVENT_LOG": "event_log",
+        "BREVO_API_KEY": "bench",
+        "SENDER_EMAIL": "bench@example.invalid",
+        # The stand-ins are local, so the upstream rate limits shouldn't be what gets measured
+        "WEATHERAPI_RATE_PER_SECOND": os.getenv("WEATHERAPI_RATE_PER_SECOND", "1000"),
+        "WEATHERAPI_BURST": os.getenv("WEATHERAPI_BURST", "1000"),
+        "PANAHON_RATE_PER_MINUTE": os.getenv("PANAHON_RATE_PER_MINUTE", "6000"),
+        # Wait out cold scrapes so get-weather-alerts measures them instead of counting 202s
+        "WEATHER_ALERTS_SYNC_WAIT": os.getenv("WEATHER_ALERTS_SYNC_WAIT", "60")
+    })
+    print(f"Panahon fixture: {os.environ['PANAHON_URL']}")
+    print(f"WeatherAPI stand-in: {weather_url}")
+    print(f"MongoDB: {args.mongo_uri} database {database}")
+    return [fixture_server, weather_server], database
+
+
+def square(lng, lat, half_side):
+    return {
+        'type': "Polygon",
+        'coordinates': [[
+            [lng - half_side, lat - half_side], [lng + half_side, lat - half_side],
+            [lng + half_side, lat + half_side], [lng - half_side, lat + half_side],
+            [lng - half_side, lat - half_side]
+        ]]
+    }
+
+
+def seed_fences(db, count, rng):
+    """Insert `count` small square fences; returns their centres and names"""
+    fences = []
+    documents = []
+    for i in range(count):
+        lat = rng.uniform(*LAT_RANGE)
+        lng = rng.uniform(*LNG_RANGE)
+        name = f"bench-fence-{i}"
+        fences.append((lng, lat, name))
+        documents.append({
+            'type': "Feature",
+            'geometry': square(lng, lat, 0.005),
+            'properties': {'name': name, 'is_active': i % 2 == 0}
+        })
+    for start in range(0, len(documents), 1000):
+        db.shapes.insert_many(documents[start:start + 1000], ordered=False)
+    db.fence_meta.update_one({'_id': 'shapes'}, {'$inc': {'version': 1}}, upsert=True)
+    print(f"Seeded {count} fence(s)")
+    return fences
+
+
+def wait_for_warm_up(app_module, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not app_module.startup_state['warmed_up'] and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+
+def save_tracking_scenario(flask_app, args, fences, rng):
+    def operation(client, i):
+        # Alternate points inside a fence and random points, so the geofence engine sees enters and exits
+        if i % 2 == 0 and fences:
+            lng, lat, _ = fences[rng.randrange(len(fences))]
+        else:
+            lng, lat = rng.uniform(*LNG_RANGE), rng.uniform(*LAT_RANGE)
+        response = client.post('/save-tracking', json={
+            'type': "Feature",
+            'properties': {'userId': f"bench-user-{i % args.users}",
+                           'timestamp': datetime.now(timezone.utc).isoformat()},
+            'geometry': {'type': "Point", 'coordinates': [lng, lat]}
+        })
+        return response.status_code == 200
+
+    return run_load('save-tracking', flask_app.test_client, operation, args.requests, args.concurrency)
+
+
+def log_alert_event_scenario(flask_app, args, fences, rng):
+    def operation(client, i):
+        _, _, name = fences[rng.randrange(len(fences))] if fences else (0, 0, "bench-fence")
+        response = client.post('/log-alert-event', json={
+            'userId': f"bench-user-{i % args.users}",
+            'fenceName': name,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        return response.status_code == 200
+
+    return run_load('log-alert-event', flask_app.test_client, operation, args.requests, args.concurrency)
+
+
+def weather_alerts_scenario(flask_app, args):
+    locations = PROVINCES[:max(1, min(args.locations, len(PROVINCES)))]
+
+    def operation(client, i):
+        response = client.get('/get-weather-alerts', query_string={'location': locations[i % len(locations)]})
+        # 202 means the scrape outlived WEATHER_ALERTS_SYNC_WAIT
+        return response.status_code == 200
+
+    return run_load('get-weather-alerts', flask_app.test_client, operation,
+                    args.weather_requests, args.concurrency)
+
+
+def worker_pass_scenario(args):
+    import worker
+
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(args.passes):
+        pass_started = time.perf_counter()
+        # Forced, so every pass evaluates every fence regardless of the adaptive schedule
+        stats = worker.reconcile(force=True)
+        if stats is None:
+            errors += 1
+        else:
+            durations.append(time.perf_counter() - pass_started)
+    elapsed = time.perf_counter() - started
+
+    result = summarize(f"worker-pass ({args.fences} fences)", durations, errors, elapsed)
+    # Fences evaluated per second rather than passes per second
+    result['throughput_rps'] = round(args.fences * len(durations) / elapsed, 1) if elapsed > 0 else None
+    return result
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    servers, database = configure_environment(args)
+    scenarios = SCENARIOS if args.scenario == 'all' else [args.scenario]
+
+    from handlers.mongo_handler import get_database
+    db = get_database()
+    fences = seed_fences(db, args.fences, rng)
+
+    results = []
+    app_module = None
+    try:
+        if any(scenario != 'worker-pass' for scenario in scenarios):
+            import app as app_module
+            from handlers.email_dispatcher import EmailDispatcher
+            # Emails go to the sink; a short window keeps digests flowing during the run
+            app_module.email_dispatcher = EmailDispatcher(manager_factory=EmailSink, coalesce_window=1)
+            flask_app = app_module.create_app()
+            wait_for_warm_up(app_module)
+
+            if 'save-tracking' in scenarios:
+                results.append(save_tracking_scenario(flask_app, args, fences, rng))
+            if 'log-alert-event' in scenarios:
+                results.append(log_alert_event_scenario(flask_app, args, fences, rng))
+            if 'get-weather-alerts' in scenarios:
+                results.append(weather_alerts_scenario(flask_app, args))
+
+        if 'worker-pass' in scenarios:
+            results.append(worker_pass_scenario(args))
+    finally:
+        if app_module is not None:
+            app_module.shutdown_app()
+        if not args.keep_db:
+            from handlers.mongo_handler import get_client, close_client
+            get_client().drop_database(database)
+            close_client()
+        for server in servers:
+            server.shutdown()
+
+    print()
+    print_table(results)
+    print("(worker-pass throughput is fences evaluated per second)")
+    print(f"Emails delivered to the sink: {EmailSink.sent}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'args': vars(args), 'results': results, 'emails_sent': EmailSink.sent}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
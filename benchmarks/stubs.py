@@ -0,0 +1,108 @@
+"""
+Local stand-ins for the upstream services: a static server for the Panahon
+fixture, a fake WeatherAPI and an email sink that replaces Brevo.
+"""
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from functools import partial
+from threading import Thread, Lock
+import json
+import os
+import time
+import zlib
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Same names as the fixture page, so WeatherAPI regions line up with advisories
+PROVINCES = [
+    'Albay', 'Camarines Sur', 'Sorsogon', 'Catanduanes', 'Masbate', 'Quezon',
+    'Batangas', 'Cavite', 'Laguna', 'Rizal', 'Bulacan', 'Pampanga',
+    'Pangasinan', 'Ilocos Norte', 'Cebu', 'Bohol', 'Leyte', 'Samar',
+    'Davao del Sur', 'Bukidnon', 'Palawan', 'Iloilo', 'Negros Occidental', 'Zambales'
+]
+
+
+def start_server(server):
+    Thread(target=server.serve_forever, name=f"stub-{server.server_port}", daemon=True).start()
+    return server
+
+
+class QuietStaticHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(host="127.0.0.1", port=0):
+    """Serve benchmarks/fixtures; returns (server, base URL)"""
+    handler = partial(QuietStaticHandler, directory=FIXTURES_DIR)
+    server = start_server(ThreadingHTTPServer((host, port), handler))
+    return server, f"http://{host}:{server.server_port}"
+
+
+class FakeWeatherApiHandler(BaseHTTPRequestHandler):
+    """
+    current.json with a deterministic region and precipitation per rounded
+    coordinate. `latency` (seconds) is set on the server.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.endswith("/current.json"):
+            return self.__reply(404, {"error": {"message": "Not found"}})
+        try:
+            lat, lng = (float(part) for part in parse_qs(url.query)["q"][0].split(","))
+        except (KeyError, ValueError):
+            return self.__reply(400, {"error": {"message": "Parameter q is missing or invalid"}})
+
+        time.sleep(self.server.latency)
+        seed = zlib.crc32(f"{round(lat, 1)},{round(lng, 1)}".encode())
+        self.__reply(200, {
+            "location": {
+                "name": f"Town {seed % 1000}",
+                "region": PROVINCES[seed % len(PROVINCES)],
+                "country": "Philippines",
+                "tz_id": "Asia/Manila",
+                "lat": lat,
+                "lon": lng
+            },
+            "current": {
+                "condition": {"text": "Light rain"},
+                "precip_mm": (seed % 200) / 10.0
+            }
+        })
+
+    def __reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_weatherapi_server(latency=0.02, host="127.0.0.1", port=0):
+    """Fake WeatherAPI; returns (server, base URL to use as WEATHERAPI_BASE_URL)"""
+    server = ThreadingHTTPServer((host, port), FakeWeatherApiHandler)
+    server.latency = latency
+    start_server(server)
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+class EmailSink:
+    """Stands in for EmailManager: records messages instead of calling Brevo"""
+
+    sent = 0
+    latency = 0.05
+    _lock = Lock()
+
+    def get_receiver(self):
+        return "bench@example.invalid"
+
+    def send_message(self, text, subject="🚨 Geofence Alert"):
+        time.sleep(EmailSink.latency)
+        with EmailSink._lock:
+            EmailSink.sent += 1
+        return True
@@ -0,0 +1,75 @@
+# Production server config: gunicorn -c gunicorn.conf.py
+# Each worker builds its own app (and MongoClient pool) via create_app()
+# after the fork, so nothing network-bound is shared across processes.
+import glob
+import math
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+
+def available_cpus():
+    """
+    CPUs this container may use: the cgroup CPU quota when there is one,
+    else the CPUs the process is allowed to run on. cpu_count() reports
+    the host's cores, which on a shared host can be dozens.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota of -1 means unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0:
+                cpus = min(cpus, math.ceil(quota / period))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+
+# One process per available core by default; every worker may run its own
+# warm browser pool (PANAHON_POOL_SIZE), so don't oversubscribe memory
+workers = int(os.getenv("WEB_CONCURRENCY", available_cpus()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Never share pre-fork state; MongoClient is not fork-safe
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+# Workers publish their metrics here so /metrics on any of them reports the
+# whole server; set in the master so every forked worker inherits it
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"flask-server-metrics-{bind.rsplit(':', 1)[-1]}"))
+
+
+def on_starting(server):
+    # Start from zero: files left by a previous server would inflate the totals
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def worker_exit(server, worker):
+    # Flush buffered trail points and pending emails, then close MongoDB
+    from app import shutdown_app
+    shutdown_app()
@@ -0,0 +1,72 @@
+from handlers.cache_handler import normalize_location
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+
+
+class AdvisorySnapshotStore:
+    """
+    Latest Panahon advisory per (location, alert type) in MongoDB.
+
+    Whoever scrapes (mostly the worker) saves what it found with a
+    fetched_at time; readers take the snapshot while it is younger than
+    `max_age` seconds and only scrape themselves when it is stale or missing.
+    One document per location and alert type, upserted in place, so lookups
+    are a single indexed query on (location_key, alert_type).
+    """
+
+    def __init__(self, collection_factory, alert_types, max_age=1800):
+        # Resolved on first use so the MongoClient is created in the process that uses it
+        self.__collection_factory = collection_factory
+        self.__alert_types = list(alert_types)
+        self.__max_age = max_age
+
+    def save(self, advisories, fetched_at=None):
+        """Store {location: {alert_type: content}} from a completed scrape"""
+        fetched_at = fetched_at or datetime.now(timezone.utc)
+        updates = []
+        for location, advisory in advisories.items():
+            if not advisory:
+                # A failed scrape says nothing about the advisories
+                continue
+            key = normalize_location(location)
+            for alert_type in self.__alert_types:
+                content = advisory.get(alert_type)
+                content = content.strip() if isinstance(content, str) else content
+                updates.append(UpdateOne(
+                    {'location_key': key, 'alert_type': alert_type},
+                    {'$set': {
+                        'location': location,
+                        'content': content or None,
+                        'active': bool(content),
+                        'fetched_at': fetched_at
+                    }},
+                    upsert=True
+                ))
+        if updates:
+            self.__collection_factory().bulk_write(updates, ordered=False)
+        return len(updates)
+
+    def expires_in(self, fetched_at):
+        """Seconds until a snapshot fetched at fetched_at is too old to serve"""
+        return self.__max_age - (datetime.now(timezone.utc) - fetched_at).total_seconds()
+
+    def latest(self, location):
+        """(advisory, fetched_at) for location if a fresh snapshot of every alert type exists, else None"""
+        cursor = self.__collection_factory().find(
+            {'location_key': normalize_location(location)},
+            {'alert_type': 1, 'content': 1, 'fetched_at': 1, '_id': 0}
+        )
+        advisory = {}
+        oldest = None
+        for document in cursor:
+            fetched_at = document['fetched_at']
+            if fetched_at.tzinfo is None:
+                fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+            advisory[document['alert_type']] = document.get('content')
+            oldest = fetched_at if oldest is None else min(oldest, fetched_at)
+
+        if oldest is None or any(alert_type not in advisory for alert_type in self.__alert_types):
+            return None
+        if self.expires_in(oldest) < 0:
+            return None
+        return {alert_type: advisory[alert_type] for alert_type in self.__alert_types}, oldest
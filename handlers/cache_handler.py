@@ -0,0 +1,112 @@
+from handlers import metrics
+from concurrent.futures import Future
+from collections import OrderedDict
+from threading import Thread, Lock
+import time
+
+
+def normalize_location(location):
+    """Cache key for a location: case-insensitive with collapsed whitespace"""
+    return " ".join(str(location).split()).casefold()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a time-to-live per entry.
+
+    - Concurrent misses for the same key share one loader call (single-flight).
+    - For `stale_ttl` seconds after expiry the old value is still served while
+      one background refresh runs, so callers never wait on a reload.
+    - Loader exceptions are not cached; they propagate to every waiting caller.
+    - Lookups are counted per `name` as hit, stale, miss or shared (joined a load).
+    """
+
+    def __init__(self, ttl, max_entries=256, stale_ttl=0, name="cache"):
+        self.__name = name
+        self.__ttl = ttl
+        self.__stale_ttl = stale_ttl
+        self.__max_entries = max_entries
+        self.__entries = OrderedDict()  # key -> (value, stored_at)
+        self.__in_flight = {}  # key -> Future
+        self.__lock = Lock()
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() at most once per refresh"""
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.__ttl:
+                    self.__entries.move_to_end(key)
+                    metrics.CACHE_LOOKUPS.inc(cache=self.__name, result="hit")
+                    return value
+                if age < self.__ttl + self.__stale_ttl:
+                    self.__entries.move_to_end(key)
+                    metrics.CACHE_LOOKUPS.inc(cache=self.__name, result="stale")
+                    if key not in self.__in_flight:
+                        flight = Future()
+                        self.__in_flight[key] = flight
+                        Thread(
+                            target=self.__load,
+                            args=(key, loader, flight),
+                            daemon=True
+                        ).start()
+                    return value
+
+            flight = self.__in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self.__in_flight[key] = flight
+        metrics.CACHE_LOOKUPS.inc(cache=self.__name, result="miss" if leader else "shared")
+
+        if leader:
+            self.__load(key, loader, flight)
+        return flight.result()
+
+    def get(self, key):
+        """Return a fresh cached value or None, without loading"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or time.monotonic() - entry[1] >= self.__ttl:
+                return None
+            return entry[0]
+
+    def put(self, key, value, ttl=None):
+        """Store value; a ttl shorter than the cache's makes it expire that much sooner"""
+        with self.__lock:
+            self.__store(key, value, ttl)
+
+    def invalidate(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __load(self, key, loader, flight):
+        try:
+            value = loader()
+        except Exception as e:
+            with self.__lock:
+                self.__in_flight.pop(key, None)
+            flight.set_exception(e)
+            return
+
+        with self.__lock:
+            self.__store(key, value)
+            self.__in_flight.pop(key, None)
+        flight.set_result(value)
+
+    def __store(self, key, value, ttl=None):
+        stored_at = time.monotonic()
+        if ttl is not None and ttl < self.__ttl:
+            # Backdate the entry so it is fresh for ttl seconds only
+            stored_at -= self.__ttl - ttl
+        self.__entries[key] = (value, stored_at)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
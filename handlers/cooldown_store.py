@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+import os
+import time
+
+
+class MemoryCooldownBackend:
+    """Per-process cooldowns: bounded LRU of key -> expiry (epoch seconds)"""
+
+    def __init__(self, max_entries=100000):
+        self.__max_entries = max_entries
+        self.__expiries = OrderedDict()
+        self.__lock = Lock()
+
+    def acquire(self, key, ttl_seconds):
+        """Start a cooldown for key unless one is running; True if it was started"""
+        now = time.time()
+        with self.__lock:
+            expires_at = self.__expiries.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self.__set(key, now + ttl_seconds)
+            return True
+
+    def mark(self, key, ttl_seconds):
+        """Record a cooldown that started elsewhere (used when warming)"""
+        with self.__lock:
+            current = self.__expiries.get(key, 0)
+            self.__set(key, max(current, time.time() + ttl_seconds))
+
+    def __set(self, key, expires_at):
+        self.__expiries[key] = expires_at
+        self.__expiries.move_to_end(key)
+        # Drop expired entries from the old end, then enforce the size bound
+        now = time.time()
+        while self.__expiries:
+            oldest_key, oldest_expiry = next(iter(self.__expiries.items()))
+            if oldest_expiry > now and len(self.__expiries) <= self.__max_entries:
+                break
+            self.__expiries.popitem(last=False)
+
+
+class RedisCooldownBackend:
+    """Cooldowns shared by every app process through Redis keys with a TTL"""
+
+    def __init__(self, url, prefix="cooldown:"):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("COOLDOWN_REDIS_URL is set but the 'redis' package is not installed")
+        self.__client = redis.Redis.from_url(url)
+        self.__prefix = prefix
+
+    def acquire(self, key, ttl_seconds):
+        # SET NX PX is atomic, so only one process wins the cooldown
+        return bool(self.__client.set(self.__prefix + key, 1, nx=True, px=int(ttl_seconds * 1000)))
+
+    def mark(self, key, ttl_seconds):
+        self.__client.set(self.__prefix + key, 1, nx=True, px=int(ttl_seconds * 1000))
+
+
+class CooldownStore:
+    """Email cooldown per (user_id, fence_name), checked without a database round-trip"""
+
+    def __init__(self, backend):
+        self.__backend = backend
+
+    def should_send(self, user_id, fence_name, cooldown_minutes):
+        """True (and the cooldown starts) if no alert email went out for this pair recently"""
+        if cooldown_minutes <= 0:
+            return True
+        return self.__backend.acquire(self.__key(user_id, fence_name), cooldown_minutes * 60)
+
+    def warm(self, event_log, cooldown_minutes):
+        """Load alerts from the last cooldown window so a restart doesn't resend emails"""
+        if cooldown_minutes <= 0:
+            return 0
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=cooldown_minutes)
+        loaded = 0
+        cursor = event_log.find(
+            # Dates, plus legacy ISO strings not migrated yet; exits never sent an email
+            {"$or": [{"time_stamp": {"$gte": cutoff}}, {"time_stamp": {"$gte": cutoff.isoformat()}}],
+             "event": {"$ne": "exit"}},
+            {"user_id": 1, "fence_name": 1, "time_stamp": 1, "_id": 0}
+        )
+        for event in cursor:
+            sent_at = event.get("time_stamp")
+            try:
+                if not isinstance(sent_at, datetime):
+                    sent_at = datetime.fromisoformat(str(sent_at))
+                if sent_at.tzinfo is None:
+                    sent_at = sent_at.replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            remaining = (sent_at + timedelta(minutes=cooldown_minutes) - now).total_seconds()
+            if remaining > 0:
+                self.__backend.mark(self.__key(event.get("user_id"), event.get("fence_name")), remaining)
+                loaded += 1
+        print(f"⏳ Cooldown store warmed with {loaded} recent alert(s)")
+        return loaded
+
+    def __key(self, user_id, fence_name):
+        return f"{user_id}\x1f{fence_name}"
+
+
+def build_cooldown_store():
+    """Redis-backed when COOLDOWN_REDIS_URL is set, otherwise in-process memory"""
+    redis_url = os.getenv("COOLDOWN_REDIS_URL")
+    if redis_url:
+        return CooldownStore(RedisCooldownBackend(redis_url))
+    return CooldownStore(MemoryCooldownBackend(int(os.getenv("COOLDOWN_MAX_ENTRIES", 100000))))
@@ -0,0 +1,175 @@
+from handlers.rate_limit import TokenBucket
+from handlers import metrics
+from datetime import datetime, timezone
+from threading import Thread, Lock, Event
+import atexit
+import queue
+import time
+
+
+def format_alert(alert):
+    return (f"User {alert['user_id']} entered the geofence '{alert['fence_name']}' "
+            f"at {alert['time']} UTC")
+
+
+def build_digest(alerts):
+    """Message text for one or more alerts going to the same recipient"""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        return (f"Alert: User {alert['user_id']} has entered the geofence '{alert['fence_name']}'.\n\n"
+                f"Time: {alert['time']} UTC\n"
+                f"Fence: {alert['fence_name']}")
+
+    lines = "\n".join(f"- {format_alert(alert)}" for alert in alerts)
+    return f"{len(alerts)} geofence alerts:\n\n{lines}"
+
+
+class EmailDispatcher:
+    """
+    Bounded email pipeline for alert notifications.
+
+    Alerts go into a bounded queue. A coalescer groups alerts for the same
+    recipient that arrive within `coalesce_window` seconds into one digest
+    (of at most `max_digest` alerts),
+    and a fixed pool of sender threads delivers digests through a single
+    shared EmailManager, throttled by a token bucket. Threads and memory
+    stay flat no matter how many alerts arrive.
+    """
+
+    def __init__(self, manager_factory=None, workers=2, max_queue=1000,
+                 coalesce_window=30, max_digest=50, rate_per_second=2, burst=5):
+        self.__manager_factory = manager_factory
+        self.__manager = None
+        self.__manager_lock = Lock()
+        self.__workers = workers
+        self.__coalesce_window = coalesce_window
+        self.__max_digest = max_digest
+        self.__limiter = TokenBucket(rate_per_second, burst)
+
+        self.__alerts = queue.Queue(maxsize=max_queue)
+        self.__digests = queue.Queue(maxsize=max_queue)
+        self.__pending = {}  # recipient -> {'first_at', 'alerts', 'callbacks'}
+
+        self.__started = False
+        self.__start_lock = Lock()
+        self.__stopping = Event()
+        self.__threads = []
+
+    def submit(self, fence_name, user_id, timestamp=None, callback=None):
+        """
+        Queue an alert email. callback(success) runs once its digest was sent
+        or failed. Returns False (without calling back) if the queue is full.
+        """
+        self.__ensure_started()
+        alert = {
+            'fence_name': fence_name,
+            'user_id': user_id,
+            'time': timestamp or datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'callback': callback
+        }
+        try:
+            self.__alerts.put_nowait(alert)
+            metrics.EMAIL_ALERTS.inc(result="queued")
+            return True
+        except queue.Full:
+            print(f"✗ Email queue full, dropping alert for fence '{fence_name}'")
+            metrics.EMAIL_ALERTS.inc(result="queue_full")
+            return False
+
+    def backlog(self):
+        return self.__alerts.qsize() + self.__digests.qsize()
+
+    def close(self, timeout=10):
+        """Flush pending digests and stop the threads"""
+        self.__stopping.set()
+        for thread in self.__threads:
+            thread.join(timeout=timeout)
+
+    def __ensure_started(self):
+        with self.__start_lock:
+            if self.__started:
+                return
+            self.__started = True
+            self.__threads.append(Thread(target=self.__coalesce_loop, name="email-coalescer", daemon=True))
+            for i in range(self.__workers):
+                self.__threads.append(Thread(target=self.__send_loop, name=f"email-sender-{i}", daemon=True))
+            for thread in self.__threads:
+                thread.start()
+            atexit.register(self.close)
+
+    def __get_manager(self):
+        # One EmailManager, and so one Brevo ApiClient, for the whole process
+        with self.__manager_lock:
+            if self.__manager is None:
+                if self.__manager_factory is None:
+                    # Brevo SDK is only imported once an email is actually sent
+                    from handlers.email_handler import EmailManager
+                    self.__manager_factory = EmailManager
+                self.__manager = self.__manager_factory()
+            return self.__manager
+
+    def __coalesce_loop(self):
+        while True:
+            stopping = self.__stopping.is_set()
+            try:
+                alert = self.__alerts.get(timeout=0.2)
+                recipient = self.__recipient()
+                group = self.__pending.setdefault(
+                    recipient, {'first_at': time.monotonic(), 'alerts': [], 'callbacks': []})
+                callback = alert.pop('callback')
+                group['alerts'].append(alert)
+                if callback is not None:
+                    group['callbacks'].append(callback)
+            except queue.Empty:
+                if stopping:
+                    # Queue drained after stop was requested: flush everything and exit
+                    self.__flush(force=True)
+                    for _ in range(self.__workers):
+                        self.__digests.put(None)
+                    return
+            self.__flush(force=stopping)
+
+    def __flush(self, force=False):
+        now = time.monotonic()
+        for recipient in list(self.__pending):
+            group = self.__pending[recipient]
+            if (force or now - group['first_at'] >= self.__coalesce_window
+                    or len(group['alerts']) >= self.__max_digest):
+                del self.__pending[recipient]
+                self.__digests.put(group)
+
+    def __recipient(self):
+        try:
+            return self.__get_manager().get_receiver()
+        except Exception:
+            return None
+
+    def __send_loop(self):
+        while True:
+            group = self.__digests.get()
+            if group is None:
+                return
+
+            success = False
+            try:
+                self.__limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    success = self.__get_manager().send_message(build_digest(group['alerts']))
+                finally:
+                    metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started,
+                                                       outcome="sent" if success else "failed")
+                fences = ", ".join(sorted({alert['fence_name'] for alert in group['alerts']}))
+                if success:
+                    print(f"✓ Email sent successfully for {len(group['alerts'])} alert(s): {fences}")
+                else:
+                    print(f"✗ Email failed to send for {len(group['alerts'])} alert(s): {fences}")
+            except Exception as e:
+                print(f"✗ Email sending failed: {e}")
+            metrics.EMAIL_ALERTS.inc(len(group['alerts']), result="sent" if success else "failed")
+
+            for callback in group['callbacks']:
+                try:
+                    callback(success)
+                except Exception as e:
+                    print(f"✗ Email callback failed: {e}")
@@ -34,18 +34,27 @@ class EmailManager:
         """Create email message"""
         self.__message_text = text
 
+    def get_receiver(self):
+        return self.__receiver_email
+
     def send_alert_email(self):
         """Send email using Brevo API"""
         if not self.__message_text:
             raise ValueError("No message created. Call create_message() first.")
+        return self.send_message(self.__message_text)
 
+    def send_message(self, text, subject="🚨 Geofence Alert"):
+        """
+        Send one message without touching create_message() state, so a single
+        EmailManager (and its API client) can be shared by several threads.
+        """
         try:
             # Create email object
             send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
                 to=[{"email": self.__receiver_email}],
                 sender={"name": self.__sender_name, "email": self.__sender_email},
-                subject="🚨 Geofence Alert",
-                text_content=self.__message_text
+                subject=subject,
+                text_content=text
             )
 
             # Send email
@@ -60,4 +69,4 @@ class EmailManager:
             return False
         except Exception as e:
             print(f"✗ Failed to send email: {type(e).__name__}: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,136 @@
+from handlers.mongo_handler import to_utc_datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+import json
+import math
+
+EARTH_RADIUS_M = 6378100.0
+
+TRAIL_PROJECTION = {'geometry': 1, 'properties.timestamp': 1, 'created_at': 1}
+SHAPE_PROJECTION = {'geometry': 1, 'properties.name': 1, 'properties.is_active': 1, 'properties.radius': 1}
+
+
+def parse_bbox(value):
+    """GeoJSON Polygon for "minLng,minLat,maxLng,maxLat"; raises ValueError if malformed"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError("bbox is out of range or empty")
+    return {
+        'type': "Polygon",
+        'coordinates': [[
+            [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+        ]]
+    }
+
+
+def circle_polygon(lng, lat, radius_m, sides=32):
+    """
+    GeoJSON Polygon approximating a circle. $geoIntersects has no circle
+    operator, and $centerSphere only matches shapes entirely inside it.
+    """
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90) or radius_m <= 0:
+        raise ValueError("lng, lat or radius is out of range")
+    angular = radius_m / EARTH_RADIUS_M
+    lat_r, lng_r = math.radians(lat), math.radians(lng)
+    ring = []
+    for i in range(sides):
+        bearing = 2 * math.pi * i / sides
+        point_lat = math.asin(math.sin(lat_r) * math.cos(angular)
+                              + math.cos(lat_r) * math.sin(angular) * math.cos(bearing))
+        point_lng = lng_r + math.atan2(math.sin(bearing) * math.sin(angular) * math.cos(lat_r),
+                                       math.cos(angular) - math.sin(lat_r) * math.sin(point_lat))
+        ring.append([math.degrees(point_lng), math.degrees(point_lat)])
+    ring.append(ring[0])
+    return {'type': "Polygon", 'coordinates': [ring]}
+
+
+def trail_query(user_id, start=None, end=None, bbox=None):
+    """Trail points of one user, optionally within [start, end) and a bbox"""
+    query = {'$or': [{'properties.userId': user_id}, {'properties.user_id': user_id}]}
+    window = {}
+    if start:
+        window['$gte'] = to_utc_datetime(start)
+    if end:
+        window['$lt'] = to_utc_datetime(end)
+    if window:
+        query['created_at'] = window
+    if bbox:
+        query['geometry'] = {'$geoWithin': {'$geometry': parse_bbox(bbox)}}
+    return query
+
+
+def shapes_query(bbox, active=None):
+    """Shapes intersecting a bbox, optionally only active (or inactive) ones"""
+    query = {'geometry': {'$geoIntersects': {'$geometry': parse_bbox(bbox)}}}
+    if active is not None:
+        query['properties.is_active'] = active
+    return query
+
+
+def nearby_fences_query(lng, lat, radius_m):
+    """Active fences touching the circle of radius_m metres around (lng, lat)"""
+    return {
+        'geometry': {'$geoIntersects': {'$geometry': circle_polygon(lng, lat, radius_m)}},
+        'properties.is_active': True
+    }
+
+
+def parse_after(value):
+    """ObjectId to resume after, from the previous page's next_after"""
+    if not value:
+        return None
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError("after must be the next_after value of a previous page")
+
+
+def parse_flag(name, value):
+    """Optional boolean query parameter: 1/true, 0/false, or None when absent"""
+    if value is None:
+        return None
+    if value.lower() in ("1", "true"):
+        return True
+    if value.lower() in ("0", "false"):
+        return False
+    raise ValueError(f"{name} must be 1, 0, true or false")
+
+
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_ndjson(collection, query, projection, after=None, limit=1000, batch_size=500):
+    """
+    One page of results as NDJSON lines, read through a cursor in _id order
+    and written out as they arrive. The last line is
+    {"page": {"count", "next_after"}}; pass next_after back as `after` to get
+    the next page, null means there are no more.
+    """
+    if after is not None:
+        query = {'$and': [query, {'_id': {'$gt': after}}]}
+    # One extra document tells whether another page exists
+    cursor = collection.find(query, projection).sort('_id', 1).limit(limit + 1).batch_size(batch_size)
+    count = 0
+    last_id = None
+    has_more = False
+    try:
+        for document in cursor:
+            if count == limit:
+                has_more = True
+                break
+            count += 1
+            last_id = document['_id']
+            yield json.dumps(document, default=json_default) + "\n"
+    finally:
+        cursor.close()
+    page = {'count': count, 'next_after': str(last_id) if has_more else None}
+    yield json.dumps({'page': page}) + "\n"
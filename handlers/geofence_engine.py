@@ -0,0 +1,297 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Thread, Lock, Event
+import math
+import time
+
+
+def point_in_ring(lng, lat, ring):
+    """Ray-casting test of a point against one closed GeoJSON ring"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def haversine_m(lng1, lat1, lng2, lat2):
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+class Fence:
+    """One active shape: Polygon, MultiPolygon, or Point with properties.radius (metres)"""
+
+    def __init__(self, fence_id, name, geometry, radius=None):
+        self.fence_id = fence_id
+        self.name = name
+        self.__type = geometry['type']
+        self.__radius = radius
+
+        if self.__type == "Polygon":
+            self.__polygons = [geometry['coordinates']]
+        elif self.__type == "MultiPolygon":
+            self.__polygons = geometry['coordinates']
+        elif self.__type == "Point" and radius:
+            self.__polygons = []
+            self.__center = geometry['coordinates'][:2]
+        else:
+            raise ValueError(f"Unsupported fence geometry: {self.__type}")
+
+        if self.__polygons:
+            xs = [p[0] for polygon in self.__polygons for p in polygon[0]]
+            ys = [p[1] for polygon in self.__polygons for p in polygon[0]]
+            self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            # Degrees of latitude/longitude covering the radius
+            d_lat = radius / 111320.0
+            d_lng = radius / (111320.0 * max(math.cos(math.radians(self.__center[1])), 1e-6))
+            lng, lat = self.__center
+            self.bbox = (lng - d_lng, lat - d_lat, lng + d_lng, lat + d_lat)
+
+    def in_bbox(self, lng, lat):
+        min_x, min_y, max_x, max_y = self.bbox
+        return min_x <= lng <= max_x and min_y <= lat <= max_y
+
+    def contains(self, lng, lat):
+        if not self.in_bbox(lng, lat):
+            return False
+        if not self.__polygons:
+            return haversine_m(lng, lat, self.__center[0], self.__center[1]) <= self.__radius
+        for polygon in self.__polygons:
+            # Inside the outer ring and outside every hole
+            if point_in_ring(lng, lat, polygon[0]) and not any(
+                    point_in_ring(lng, lat, hole) for hole in polygon[1:]):
+                return True
+        return False
+
+
+class MemoryMembership:
+    """
+    Fences each user is inside, for this process only: a bounded LRU of
+    user_id -> {fence_id: fence_name}. Only correct with a single server
+    worker; with several, each keeps its own view and repeats enter events.
+    """
+
+    def __init__(self, max_users=100000):
+        self.__max_users = max_users
+        self.__users = OrderedDict()
+        self.__lock = Lock()
+
+    def swap(self, user_id, inside):
+        """Store inside as the user's fences and return the previous ones"""
+        with self.__lock:
+            previous = self.__users.pop(user_id, {})
+            self.__users[user_id] = inside
+            while len(self.__users) > self.__max_users:
+                self.__users.popitem(last=False)
+        return previous
+
+
+class MongoMembership:
+    """
+    Fences each user is inside, shared by every server worker: one document
+    per user, swapped with a single atomic find_one_and_update so two workers
+    handling the same user never both see the same enter.
+    """
+
+    def __init__(self, collection):
+        self.__collection = collection
+
+    def swap(self, user_id, inside):
+        # Imported here so the in-memory engine works without pymongo
+        from pymongo import ReturnDocument
+
+        previous = self.__collection.find_one_and_update(
+            {'_id': user_id},
+            {'$set': {
+                'fences': [{'id': fence_id, 'name': name} for fence_id, name in inside.items()],
+                # A TTL index on updated_at forgets users that stopped reporting
+                'updated_at': datetime.now(timezone.utc)
+            }},
+            projection={'fences': 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        return {fence['id']: fence['name'] for fence in (previous or {}).get('fences', [])}
+
+
+class GeofenceEngine:
+    """
+    In-process geofence evaluation over the active shapes.
+
+    Active fences are held in a uniform grid index (cell -> fences whose
+    bbox overlaps the cell). A point is checked against the fences of its
+    cell only: bbox prefilter, then an exact point-in-polygon test. Fences
+    are reloaded in the background when the worker bumps the shapes version
+    in `meta_collection`, and on a slower fixed interval as a backstop, so
+    point checks never touch the database. Which fences a user was last
+    inside is kept by `membership` (MemoryMembership by default).
+    """
+
+    def __init__(self, shapes, meta_collection, cell_deg=0.05, poll_interval=5, reload_interval=300,
+                 membership=None):
+        self.__shapes = shapes
+        self.__meta = meta_collection
+        self.__cell_deg = cell_deg
+        self.__poll_interval = poll_interval
+        self.__reload_interval = reload_interval
+
+        self.__grid = {}
+        self.__fence_count = 0
+        self.__version = None
+        self.__loaded = False
+        self.__loaded_at = 0
+        self.__lock = Lock()
+
+        # user_id -> {fence_id: fence_name} the user was last seen inside
+        self.__membership = membership or MemoryMembership()
+
+        self.__started = False
+        self.__start_lock = Lock()
+        self.__stopping = Event()
+
+    def start(self):
+        """
+        Load fences and start the refresher; safe to call more than once.
+        The refresher starts even if the first load fails (e.g. MongoDB is
+        still unreachable) and keeps retrying until a load succeeds.
+        """
+        with self.__start_lock:
+            if self.__started:
+                return
+            self.__started = True
+            Thread(target=self.__refresh_loop, name="geofence-refresh", daemon=True).start()
+        self.reload()
+
+    def stop(self):
+        self.__stopping.set()
+
+    def fence_count(self):
+        with self.__lock:
+            return self.__fence_count
+
+    def reload(self):
+        """Rebuild the grid index from the active shapes"""
+        version = self.__read_version()
+        grid = {}
+        count = 0
+        cursor = self.__shapes.find(
+            {'properties.is_active': True},
+            {'geometry': 1, 'properties.name': 1, 'properties.radius': 1}
+        )
+        for document in cursor:
+            properties = document.get('properties', {})
+            try:
+                fence = Fence(
+                    document['_id'],
+                    properties.get('name') or str(document['_id']),
+                    document['geometry'],
+                    radius=properties.get('radius')
+                )
+            except Exception:
+                continue
+            for cell in self.__cells_for_bbox(fence.bbox):
+                grid.setdefault(cell, []).append(fence)
+            count += 1
+
+        with self.__lock:
+            self.__grid = grid
+            self.__fence_count = count
+            self.__version = version
+            self.__loaded = True
+            self.__loaded_at = time.monotonic()
+        print(f"🧭 Geofence index loaded: {count} active fence(s) in {len(grid)} cell(s)")
+
+    def evaluate(self, user_id, points):
+        """
+        Test a user's points, in order, against the active fences.
+        points: [(lng, lat, time_stamp), ...]
+        Returns enter/exit events: [{'event', 'user_id', 'fence_id', 'fence_name', 'time_stamp'}]
+        """
+        if not points:
+            return []
+        inside_sets = self.__locate_batch(points)
+
+        # One swap per batch: store where the last point is, get back where the user was
+        current = self.__membership.swap(user_id, inside_sets[-1])
+
+        events = []
+        for (lng, lat, time_stamp), inside in zip(points, inside_sets):
+            for fence_id, fence_name in inside.items():
+                if fence_id not in current:
+                    events.append(self.__event('enter', user_id, fence_id, fence_name, time_stamp))
+            for fence_id, fence_name in current.items():
+                if fence_id not in inside:
+                    events.append(self.__event('exit', user_id, fence_id, fence_name, time_stamp))
+            current = inside
+        return events
+
+    def __locate_batch(self, points):
+        """
+        For each point, {fence_id: fence_name} of the fences containing it.
+        Points are grouped per candidate fence so each fence is tested against
+        all of its points in one go instead of fence-by-fence per point.
+        """
+        with self.__lock:
+            grid = self.__grid
+
+        candidates = {}  # fence_id -> (fence, [point indexes])
+        for index, (lng, lat, _) in enumerate(points):
+            for fence in grid.get(self.__cell(lng, lat), ()):
+                candidates.setdefault(fence.fence_id, (fence, []))[1].append(index)
+
+        results = [{} for _ in points]
+        for fence, indexes in candidates.values():
+            for index in indexes:
+                lng, lat, _ = points[index]
+                if fence.contains(lng, lat):
+                    results[index][fence.fence_id] = fence.name
+        return results
+
+    def __event(self, kind, user_id, fence_id, fence_name, time_stamp):
+        return {
+            'event': kind,
+            'user_id': user_id,
+            'fence_id': fence_id,
+            'fence_name': fence_name,
+            'time_stamp': time_stamp
+        }
+
+    def __cell(self, lng, lat):
+        return math.floor(lng / self.__cell_deg), math.floor(lat / self.__cell_deg)
+
+    def __cells_for_bbox(self, bbox):
+        min_x, min_y = self.__cell(bbox[0], bbox[1])
+        max_x, max_y = self.__cell(bbox[2], bbox[3])
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield x, y
+
+    def __read_version(self):
+        try:
+            meta = self.__meta.find_one({'_id': 'shapes'})
+            return (meta or {}).get('version', 0)
+        except Exception as e:
+            print(f"✗ Could not read shapes version: {e}")
+            return None
+
+    def __refresh_loop(self):
+        while not self.__stopping.wait(self.__poll_interval):
+            try:
+                version = self.__read_version()
+                with self.__lock:
+                    # Never loaded, or loaded without knowing the version: keep trying
+                    missing = not self.__loaded or self.__version is None
+                    changed = version is not None and version != self.__version
+                    expired = time.monotonic() - self.__loaded_at >= self.__reload_interval
+                if missing or changed or expired:
+                    self.reload()
+            except Exception as e:
+                print(f"✗ Geofence refresh failed: {e}")
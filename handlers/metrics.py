@@ -0,0 +1,305 @@
+"""
+In-process metrics (counters and histograms) rendered in the Prometheus
+text format, plus structured JSON logs that carry a per-request trace id.
+
+METRICS_ENABLED=0 turns every record call into an early return and
+`Histogram.time()` into a shared no-op context. STRUCTURED_LOGS=1 turns on
+the JSON log lines.
+
+Under a multi-process server each worker has its own registry; after
+`share(directory)` every process writes its raw values to
+<directory>/<pid>.json and render() sums all of them, so whichever worker
+answers /metrics reports the totals of the whole server.
+"""
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Thread, Lock, Event
+import bisect
+import glob
+import json
+import os
+import time
+import uuid
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+STRUCTURED_LOGS = os.getenv("STRUCTURED_LOGS", "0") == "1"
+
+# Seconds; covers a cached lookup (ms) up to a cold browser scrape (a minute)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_trace_id = ContextVar("trace_id", default=None)
+_noop = nullcontext()
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.__values = {}  # label values -> count
+        self.__lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def values(self):
+        """{label values: count} recorded in this process"""
+        with self.__lock:
+            return dict(self.__values)
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values=None):
+        """Text lines for values (default: this process's own)"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        items = list((self.values() if values is None else values).items())
+        for key, value in items:
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.__series = {}  # label values -> [bucket counts..., sum, count]
+        self.__lock = Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            series = self.__series.get(key)
+            if series is None:
+                series = self.__series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Context manager observing the elapsed seconds of its block"""
+        if not ENABLED:
+            return _noop
+        return self.__timed(labels)
+
+    @contextmanager
+    def __timed(self, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def values(self):
+        """{label values: [bucket counts..., sum, count]} recorded in this process"""
+        with self.__lock:
+            return {key: list(series) for key, series in self.__series.items()}
+
+    @staticmethod
+    def merge(total, series):
+        return list(series) if total is None else [a + b for a, b in zip(total, series)]
+
+    def render(self, values=None):
+        """Text lines for values (default: this process's own)"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        items = list((self.values() if values is None else values).items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = format_labels(self.labelnames + ("le",), key + (f"{bound:g}",))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+_registry = []
+_registry_lock = Lock()
+
+
+def counter(name, help_text, labelnames=()):
+    metric = Counter(name, help_text, labelnames)
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help_text, labelnames, buckets)
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+_shared_dir = None
+_stop_sharing = Event()
+_publish_lock = Lock()
+
+
+def share(directory, interval=5):
+    """
+    Publish this process's values to `directory` every `interval` seconds
+    (and whenever render() runs) and make render() sum every process's file.
+    """
+    global _shared_dir
+    if not ENABLED or not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _shared_dir = directory
+
+    def publish_loop():
+        while not _stop_sharing.wait(interval):
+            publish()
+
+    Thread(target=publish_loop, name="metrics-publish", daemon=True).start()
+
+
+def publish():
+    """Write this process's raw values to <shared dir>/<pid>.json atomically"""
+    if _shared_dir is None:
+        return
+    with _registry_lock:
+        metrics = list(_registry)
+    snapshot = {metric.name: [[list(key), value] for key, value in metric.values().items()] for metric in metrics}
+    path = os.path.join(_shared_dir, f"{os.getpid()}.json")
+    temp_path = f"{path}.tmp"
+    try:
+        # The publisher thread and a scrape may publish at the same time
+        with _publish_lock:
+            with open(temp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, path)
+    except OSError as e:
+        print(f"✗ Could not publish metrics: {e}")
+
+
+def stop_sharing():
+    """Stop the publisher after a last write; the file stays so totals don't drop"""
+    _stop_sharing.set()
+    publish()
+
+
+def collect(metrics):
+    """{metric name: {label values: merged value}} over every process's file"""
+    publish()
+    by_name = {metric.name: metric for metric in metrics}
+    merged = {metric.name: {} for metric in metrics}
+    for path in glob.glob(os.path.join(_shared_dir, "*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            # Vanished or being replaced; its values show up on the next scrape
+            continue
+        for name, items in snapshot.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            values = merged[name]
+            for key, value in items:
+                key = tuple(key)
+                values[key] = metric.merge(values.get(key), value)
+    return merged
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    merged = collect(metrics) if _shared_dir is not None else {}
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render(merged.get(metric.name)))
+    return "\n".join(lines) + "\n"
+
+
+def dump(path):
+    """Write render() to path atomically (e.g. for node_exporter's textfile collector)"""
+    if not ENABLED or not path:
+        return
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(render())
+    os.replace(temp_path, path)
+
+
+def new_trace_id(trace_id=None):
+    """Start a trace for the current request or job; returns the id"""
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def log_event(event, **fields):
+    """One JSON log line with a timestamp and the current trace id"""
+    if not STRUCTURED_LOGS:
+        return
+    record = {"ts": datetime.now(timezone.utc).isoformat(), "event": event}
+    trace_id = _trace_id.get()
+    if trace_id:
+        record["trace_id"] = trace_id
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+
+# Metrics shared by several modules
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "Flask request latency", ("method", "endpoint", "status"))
+MONGO_COMMAND_SECONDS = histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command", "outcome"))
+WEATHERAPI_REQUEST_SECONDS = histogram(
+    "weatherapi_request_duration_seconds", "WeatherAPI call latency, retries included", ("endpoint", "outcome"))
+CACHE_LOOKUPS = counter(
+    "cache_lookups_total", "Cache lookups by result", ("cache", "result"))
+PANAHON_BROWSER_LAUNCH_SECONDS = histogram(
+    "panahon_browser_launch_seconds", "Chromium launch and new page", ("mode",))
+PANAHON_PAGE_LOAD_SECONDS = histogram(
+    "panahon_page_load_seconds", "Panahon page load until the alert panel is open", ("mode",))
+PANAHON_SCRAPE_STAGE_SECONDS = histogram(
+    "panahon_scrape_stage_seconds", "Time per scrape stage (one alert type or layer read)", ("stage", "alert_type"))
+PANAHON_SCRAPES = counter(
+    "panahon_scrapes_total", "Panahon scrapes by outcome", ("outcome",))
+PANAHON_POOL_WAIT_SECONDS = histogram(
+    "panahon_pool_wait_seconds", "Wait for a free warm page")
+UPSTREAM_CALLS = counter(
+    "upstream_calls_total", "Guarded upstream calls by outcome", ("upstream", "outcome"))
+EMAIL_SEND_SECONDS = histogram(
+    "email_send_duration_seconds", "Brevo send latency per digest", ("outcome",))
+EMAIL_ALERTS = counter(
+    "email_alerts_total", "Alert emails by what happened to them", ("result",))
+FENCE_PASS_SECONDS = histogram(
+    "fence_activation_pass_seconds", "Fence activation pass duration", ("kind",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+FENCE_SHAPES = counter(
+    "fence_activation_shapes_total", "Shapes evaluated by outcome", ("outcome",))
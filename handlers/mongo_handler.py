@@ -0,0 +1,178 @@
+from pymongo import MongoClient, ASCENDING, GEOSPHERE, monitoring
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+from handlers import metrics
+from datetime import datetime, timezone
+from threading import Lock
+import os
+
+load_dotenv()
+
+_client = None
+_client_pid = None
+_client_lock = Lock()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Feeds MongoDB command latencies into the metrics registry"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6,
+                                              command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        metrics.MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6,
+                                              command=event.command_name, outcome="error")
+
+
+def get_client():
+    """
+    MongoClient for the current process.
+
+    MongoClient is not fork-safe, so a client created before a server forked
+    its workers is never reused: each process builds its own pool on first
+    use, sized by MONGODB_MAX_POOL_SIZE. connect=False defers the actual
+    connection to the first operation, so creating it never blocks startup.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            # Fixed MongoDB connection with TLS certificate validation bypass
+            _client = MongoClient(
+                os.getenv("MONGODB_URI"),
+                tlsAllowInvalidCertificates=True,
+                connect=False,
+                serverSelectionTimeoutMS=int(os.getenv("MONGODB_SERVER_SELECTION_MS", 5000)),
+                maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", 20)),
+                minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", 0)),
+                maxIdleTimeMS=int(os.getenv("MONGODB_MAX_IDLE_MS", 300000)),
+                # No listener at all when metrics are off
+                event_listeners=[CommandMetrics()] if metrics.ENABLED else []
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_database():
+    return get_client()[os.getenv("MONGODB_DATABASE")]
+
+
+def close_client():
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            print("MongoDB connection closed")
+        _client = None
+        _client_pid = None
+
+
+def to_utc_datetime(value):
+    """UTC datetime from an ISO string or datetime; raises ValueError if it can't be parsed"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip()
+        # JavaScript's toISOString() ends in 'Z', which fromisoformat rejects before 3.11
+        if text.endswith(("Z", "z")):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def parse_timestamp(value, default=None):
+    """
+    BSON-ready UTC datetime from an ISO string or datetime.
+    Falls back to `default` (or now) when the value is missing or unparsable.
+    """
+    try:
+        return to_utc_datetime(value)
+    except (TypeError, ValueError):
+        return default or datetime.now(timezone.utc)
+
+
+def ensure_indexes(db):
+    """
+    Create the indexes the app relies on. Safe to run on every start:
+    existing indexes with the same spec are left alone.
+    """
+    event_log = db[os.getenv("EVENT_LOG")]
+    user_trail = db[os.getenv("MONGODB_COLLECTION")]
+    advisory_snapshots = db[os.getenv("ADVISORY_SNAPSHOTS", "advisory_snapshots")]
+    scrape_jobs = db[os.getenv("SCRAPE_JOBS", "scrape_jobs")]
+
+    specs = [
+        (event_log, [("user_id", ASCENDING), ("fence_name", ASCENDING), ("time_stamp", ASCENDING)],
+         {"name": "user_fence_time"}),
+        (event_log, [("notification.status", ASCENDING), ("notification.next_attempt_at", ASCENDING)],
+         {"name": "notification_outbox", "sparse": True}),
+        (user_trail, [("geometry", GEOSPHERE)], {"name": "geometry_2dsphere"}),
+        # Per-user trail reads, paged by _id (the client sends either key)
+        (user_trail, [("properties.userId", ASCENDING), ("_id", ASCENDING)], {"name": "user_id_page"}),
+        (user_trail, [("properties.user_id", ASCENDING), ("_id", ASCENDING)], {"name": "user_id_snake_page"}),
+        (db.shapes, [("geometry", GEOSPHERE)], {"name": "geometry_2dsphere"}),
+        # The worker's polling fallback looks for recently edited shapes
+        (db.shapes, [("modified_at", ASCENDING)], {"name": "modified_at", "sparse": True}),
+        # One latest snapshot per location and alert type
+        (advisory_snapshots, [("location_key", ASCENDING), ("alert_type", ASCENDING)],
+         {"name": "location_alert_type", "unique": True}),
+        # Background scrape jobs, shared by the server workers, go once expires_at passes
+        (scrape_jobs, [("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+        # Geofence membership of users that stopped reporting is forgotten after a week
+        (db.fence_membership, [("updated_at", ASCENDING)],
+         {"name": "updated_at_ttl", "expireAfterSeconds": 7 * 86400}),
+    ]
+    for collection, keys, options in specs:
+        try:
+            collection.create_index(keys, **options)
+        except Exception as e:
+            # e.g. a malformed stored geometry; the app still works without the index
+            print(f"✗ Could not create index {options['name']} on {collection.name}: {e}")
+
+    ensure_trail_retention(user_trail)
+    print("✓ MongoDB indexes ensured")
+
+
+def ensure_trail_retention(user_trail):
+    """Optional TTL on trail points: TRAIL_RETENTION_DAYS, unset keeps them forever"""
+    days = os.getenv("TRAIL_RETENTION_DAYS")
+    if not days:
+        return
+    seconds = int(float(days) * 86400)
+    try:
+        user_trail.create_index([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        # The TTL index exists with another retention: change it in place
+        if e.code not in (85, 86):
+            raise
+        user_trail.database.command({
+            "collMod": user_trail.name,
+            "index": {"name": "created_at_ttl", "expireAfterSeconds": seconds}
+        })
+
+
+def migrate_event_timestamps(event_log):
+    """Convert legacy ISO-string time_stamp values to BSON dates, server-side"""
+    result = event_log.update_many(
+        {"time_stamp": {"$type": "string"}},
+        [{"$set": {"time_stamp": {"$dateFromString": {
+            "dateString": "$time_stamp",
+            # Leave values MongoDB can't parse untouched
+            "onError": "$time_stamp"
+        }}}}]
+    )
+    return result.modified_count
+
+
+def backfill_trail_created_at(user_trail):
+    """Give older trail points a created_at (their insert time, from the ObjectId) so TTL applies"""
+    result = user_trail.update_many(
+        {"created_at": {"$exists": False}},
+        [{"$set": {"created_at": {"$toDate": "$_id"}}}]
+    )
+    return result.modified_count
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock, Event
+import atexit
+import uuid
+
+
+def format_time(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+class NotificationOutbox:
+    """
+    Transactional outbox for alert emails, stored on the event_log documents.
+
+    The request path writes the alert and its pending notification in one
+    insert (see pending_notification). A background drainer claims due
+    notifications in batches with a lease, hands them to the email
+    dispatcher and records the outcome; failures are retried with
+    exponential backoff until `max_attempts`. A crashed process's claims
+    become claimable again once their lease runs out, so nothing is lost.
+    """
+
+    def __init__(self, event_log, dispatcher, batch_size=50, poll_interval=2, lease_seconds=120,
+                 max_attempts=8, base_backoff=30, max_backoff=3600):
+        self.__event_log = event_log
+        self.__dispatcher = dispatcher
+        self.__batch_size = batch_size
+        self.__poll_interval = poll_interval
+        self.__lease = timedelta(seconds=lease_seconds)
+        self.__max_attempts = max_attempts
+        self.__base_backoff = base_backoff
+        self.__max_backoff = max_backoff
+
+        self.__wake = Event()
+        self.__stopping = Event()
+        self.__started = False
+        self.__start_lock = Lock()
+        self.__thread = None
+
+    @staticmethod
+    def pending_notification():
+        """Notification state to embed in a new event_log document"""
+        return {
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.now(timezone.utc)
+        }
+
+    def start(self):
+        with self.__start_lock:
+            if self.__started:
+                return
+            self.__started = True
+            self.__thread = Thread(target=self.__drain_loop, name="notification-outbox", daemon=True)
+            self.__thread.start()
+            atexit.register(self.stop)
+
+    def notify(self):
+        """Wake the drainer early, e.g. right after a pending notification was written"""
+        self.__wake.set()
+
+    def stop(self):
+        self.__stopping.set()
+        self.__wake.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=10)
+
+    def __drain_loop(self):
+        while not self.__stopping.is_set():
+            try:
+                claimed = self.__drain_once()
+            except Exception as e:
+                print(f"✗ Outbox drain failed: {e}")
+                claimed = 0
+            # A full batch probably means more are waiting
+            if claimed < self.__batch_size:
+                self.__wake.wait(self.__poll_interval)
+                self.__wake.clear()
+
+    def __due_filter(self, now):
+        return {"$or": [
+            {"notification.status": "pending", "notification.next_attempt_at": {"$lte": now}},
+            # Claimed by a process that never finished
+            {"notification.status": "sending", "notification.lease_until": {"$lte": now}}
+        ]}
+
+    def __drain_once(self):
+        """Claim up to batch_size due notifications and hand them to the dispatcher"""
+        now = datetime.now(timezone.utc)
+        due = self.__due_filter(now)
+        ids = [doc["_id"] for doc in self.__event_log.find(due, {"_id": 1}).limit(self.__batch_size)]
+        if not ids:
+            return 0
+
+        claim = uuid.uuid4().hex
+        self.__event_log.update_many(
+            {"_id": {"$in": ids}, **due},
+            {
+                "$set": {
+                    "notification.status": "sending",
+                    "notification.claim": claim,
+                    "notification.lease_until": now + self.__lease
+                },
+                "$inc": {"notification.attempts": 1}
+            }
+        )
+
+        claimed = 0
+        # Read back by _id (the claim field isn't indexed); the claim filter keeps only what this drainer won
+        for doc in self.__event_log.find({"_id": {"$in": ids}, "notification.claim": claim},
+                                         {"user_id": 1, "fence_name": 1, "time_stamp": 1, "notification": 1}):
+            claimed += 1
+            attempts = doc["notification"].get("attempts", 1)
+            accepted = self.__dispatcher.submit(
+                doc.get("fence_name"),
+                doc.get("user_id"),
+                timestamp=format_time(doc.get("time_stamp")),
+                callback=lambda success, _id=doc["_id"], attempts=attempts: self.__complete(
+                    _id, claim, success, attempts)
+            )
+            if not accepted:
+                # Dispatcher is saturated: give the claim back without burning an attempt
+                self.__release(doc["_id"], claim)
+        return claimed
+
+    def __complete(self, event_id, claim, success, attempts):
+        now = datetime.now(timezone.utc)
+        if success:
+            update = {"$set": {"notification.status": "sent", "notification.sent_at": now},
+                      "$unset": {"notification.claim": "", "notification.lease_until": ""}}
+        elif attempts >= self.__max_attempts:
+            update = {"$set": {"notification.status": "failed"},
+                      "$unset": {"notification.claim": "", "notification.lease_until": ""}}
+            print(f"✗ Giving up on notification {event_id} after {attempts} attempt(s)")
+        else:
+            delay = min(self.__max_backoff, self.__base_backoff * 2 ** (attempts - 1))
+            update = {"$set": {"notification.status": "pending",
+                               "notification.next_attempt_at": now + timedelta(seconds=delay)},
+                      "$unset": {"notification.claim": "", "notification.lease_until": ""}}
+        # Only the current claim holder may settle the notification
+        self.__event_log.update_one({"_id": event_id, "notification.claim": claim}, update)
+
+    def __release(self, event_id, claim):
+        self.__event_log.update_one(
+            {"_id": event_id, "notification.claim": claim},
+            {"$set": {"notification.status": "pending",
+                      "notification.next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=self.__poll_interval)},
+             "$inc": {"notification.attempts": -1},
+             "$unset": {"notification.claim": "", "notification.lease_until": ""}}
+        )
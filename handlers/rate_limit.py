@@ -0,0 +1,172 @@
+from handlers import metrics
+from threading import Lock
+import random
+import time
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.__rate = float(rate)
+        self.__capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.__tokens = self.__capacity
+        self.__updated = time.monotonic()
+        self.__lock = Lock()
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now"""
+        with self.__lock:
+            self.__refill()
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available; False if timeout passes first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.__lock:
+                self.__refill()
+                if self.__tokens >= tokens:
+                    self.__tokens -= tokens
+                    return True
+                wait = (tokens - self.__tokens) / self.__rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class RateLimited(Exception):
+    """Raised when no rate-limit token became available in time"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused for `reset_timeout` seconds. Then a single probe call
+    is let through (half-open): success closes the circuit, failure opens
+    it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.__name = name
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__state = "closed"
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__lock = Lock()
+
+    def state(self):
+        with self.__lock:
+            return self.__state
+
+    def is_open(self):
+        """True while calls are refused, without claiming the half-open probe"""
+        with self.__lock:
+            if self.__state == "half_open":
+                return True
+            return self.__state == "open" and time.monotonic() - self.__opened_at < self.__reset_timeout
+
+    def allow(self):
+        """Whether a call may go ahead now; claims the probe when the timeout has passed"""
+        with self.__lock:
+            if self.__state == "closed":
+                return True
+            if self.__state == "open" and time.monotonic() - self.__opened_at >= self.__reset_timeout:
+                self.__state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self.__lock:
+            if self.__state != "closed":
+                print(f"✓ {self.__name} circuit closed")
+            self.__state = "closed"
+            self.__failures = 0
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == "half_open" or self.__failures >= self.__failure_threshold:
+                if self.__state != "open":
+                    print(f"✗ {self.__name} circuit open for {self.__reset_timeout:g}s "
+                          f"after {self.__failures} failure(s)")
+                self.__state = "open"
+                self.__opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """
+    Everything one upstream call goes through: a token bucket caps the
+    request rate, a circuit breaker fails fast while the upstream is down,
+    and failed calls are retried up to `retries` times with jittered
+    exponential backoff. Calls that would wait longer than
+    `acquire_timeout` for a token raise RateLimited.
+    """
+
+    def __init__(self, name, rate, burst=None, failure_threshold=5, reset_timeout=30,
+                 retries=0, base_backoff=0.5, max_backoff=8, acquire_timeout=5):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.__bucket = TokenBucket(rate, burst)
+        self.__retries = retries
+        self.__base_backoff = base_backoff
+        self.__max_backoff = max_backoff
+        self.__acquire_timeout = acquire_timeout
+
+    def call(self, fn, is_failure=None):
+        """
+        Return fn(). Exceptions count as failures, and so do results for
+        which is_failure(result) is true; the last failed result is returned
+        once the retries are used up.
+        """
+        attempt = 0
+        while True:
+            # Don't wait for a token just to be refused by an open circuit
+            if self.breaker.is_open():
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="circuit_open")
+                raise CircuitOpen(f"{self.name} is unavailable, circuit open")
+            if not self.__bucket.acquire(timeout=self.__acquire_timeout):
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="rate_limited")
+                raise RateLimited(f"{self.name} rate limit reached")
+            if not self.breaker.allow():
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="circuit_open")
+                raise CircuitOpen(f"{self.name} is unavailable, circuit open")
+
+            try:
+                result = fn()
+            except Exception:
+                self.breaker.record_failure()
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="failed")
+                if attempt >= self.__retries:
+                    raise
+            else:
+                if is_failure is None or not is_failure(result):
+                    self.breaker.record_success()
+                    metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="ok")
+                    return result
+                self.breaker.record_failure()
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="failed")
+                if attempt >= self.__retries:
+                    return result
+
+            delay = min(self.__max_backoff, self.__base_backoff * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
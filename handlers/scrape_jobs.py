@@ -0,0 +1,184 @@
+from handlers.cache_handler import normalize_location
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from threading import Lock, Event
+import contextvars
+import time
+import uuid
+
+
+class ScrapeJob:
+    def __init__(self, location):
+        self.job_id = uuid.uuid4().hex
+        self.location = location
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.finished_mono = None
+        self.done = Event()
+
+    @classmethod
+    def from_document(cls, document):
+        """A job another process runs, as last written to MongoDB"""
+        job = cls(document['location'])
+        job.job_id = document['_id']
+        job.update(document)
+        return job
+
+    def update(self, document):
+        self.status = document['status']
+        self.result = document.get('result')
+        self.error = document.get('error')
+        self.created_at = as_utc(document['created_at'])
+        self.finished_at = as_utc(document.get('finished_at'))
+        if self.finished_at is not None:
+            self.done.set()
+
+    def to_document(self, expires_at):
+        return {
+            "_id": self.job_id,
+            "location": self.location,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "expires_at": expires_at
+        }
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "location": self.location,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+def as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class ScrapeJobManager:
+    """
+    Runs advisory lookups as background jobs on a dedicated executor so
+    request threads never wait on a browser. Jobs for the same location
+    that are still queued or running are coalesced into one. Finished jobs
+    are kept for `job_ttl` seconds so callers can poll for the result.
+
+    With a `collection_factory` every job is also written to MongoDB, so a
+    poll that lands on another server worker than the one running the job
+    still finds it; a TTL index on expires_at removes old jobs there.
+    """
+
+    def __init__(self, loader, workers=2, job_ttl=600, max_jobs=1000, collection_factory=None, poll_interval=1.0):
+        self.__loader = loader
+        # Resolved on first use so the MongoClient is created in the process that uses it
+        self.__collection_factory = collection_factory
+        self.__poll_interval = poll_interval
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrape-job")
+        self.__job_ttl = job_ttl
+        self.__max_jobs = max_jobs
+        self.__jobs = OrderedDict()  # job_id -> ScrapeJob
+        self.__active = {}  # location key -> ScrapeJob still queued or running
+        self.__lock = Lock()
+
+    def submit(self, location):
+        """Start (or join) a job for location and return it"""
+        key = normalize_location(location)
+        with self.__lock:
+            self.__expire()
+            job = self.__active.get(key)
+            if job is not None:
+                return job
+
+            job = ScrapeJob(location)
+            self.__jobs[job.job_id] = job
+            self.__active[key] = job
+        self.__save(job)
+        # Keep the submitting request's trace id in the job's logs
+        self.__executor.submit(contextvars.copy_context().run, self.__run, job, key)
+        return job
+
+    def get(self, job_id):
+        """The job with job_id, whichever process runs it, or None if unknown or expired"""
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+        if job is not None or self.__collection_factory is None:
+            return job
+        try:
+            document = self.__collection_factory().find_one({"_id": job_id})
+        except Exception as e:
+            print(f"✗ Could not read scrape job {job_id}: {e}")
+            return None
+        return ScrapeJob.from_document(document) if document else None
+
+    def wait(self, job, timeout):
+        """Wait up to timeout seconds for job to finish; True if it has"""
+        with self.__lock:
+            local = self.__jobs.get(job.job_id) is job
+        if local or self.__collection_factory is None or job.done.is_set():
+            return job.done.wait(timeout)
+
+        # Run by another process: poll its document
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                document = self.__collection_factory().find_one({"_id": job.job_id})
+            except Exception as e:
+                print(f"✗ Could not read scrape job {job.job_id}: {e}")
+                document = None
+            if document is not None:
+                job.update(document)
+                if job.done.is_set():
+                    return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.__poll_interval, remaining))
+
+    def __save(self, job):
+        if self.__collection_factory is None:
+            return
+        # Unfinished jobs also expire, in case the process running them dies
+        expires_at = (job.finished_at or job.created_at) + timedelta(seconds=self.__job_ttl)
+        try:
+            self.__collection_factory().replace_one({"_id": job.job_id}, job.to_document(expires_at), upsert=True)
+        except Exception as e:
+            # The job still runs; only polls on other workers miss it
+            print(f"✗ Could not save scrape job {job.job_id}: {e}")
+
+    def __run(self, job, key):
+        job.status = "running"
+        self.__save(job)
+        try:
+            job.result = self.__loader(job.location)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            job.finished_mono = time.monotonic()
+            self.__save(job)
+            with self.__lock:
+                if self.__active.get(key) is job:
+                    del self.__active[key]
+            job.done.set()
+
+    def __expire(self):
+        now = time.monotonic()
+        for job_id in list(self.__jobs):
+            job = self.__jobs[job_id]
+            expired = job.finished_mono is not None and now - job.finished_mono >= self.__job_ttl
+            # Over the cap, drop the oldest finished jobs first
+            over_cap = len(self.__jobs) > self.__max_jobs and job.finished_mono is not None
+            if expired or over_cap:
+                del self.__jobs[job_id]
@@ -0,0 +1,123 @@
+from pymongo.errors import BulkWriteError
+from collections import deque
+from threading import Thread, Condition, Lock
+import atexit
+import time
+
+
+class BufferFull(Exception):
+    """Raised when the buffer stays full for longer than the caller is willing to wait"""
+
+    def __init__(self, accepted):
+        super().__init__(f"Trail buffer full, {accepted} point(s) accepted")
+        self.accepted = accepted
+
+
+class TrailWriteBuffer:
+    """
+    Server-side write buffer for trail points.
+
+    Documents are flushed to MongoDB with insert_many once `batch_size`
+    are waiting or `flush_interval` seconds have passed, whichever comes
+    first. At most `max_pending` documents are held; producers block for
+    up to `timeout` seconds when it is full and then get BufferFull.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=1.0, max_pending=10000, max_retries=3):
+        self.__collection = collection
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__max_pending = max_pending
+        self.__max_retries = max_retries
+        self.__pending = deque()
+        self.__cond = Condition()
+        self.__start_lock = Lock()
+        self.__flusher = None
+        self.__stopping = False
+        self.__stats = {'inserted': 0, 'dropped': 0, 'flushes': 0}
+
+    def add_many(self, documents, timeout=5.0):
+        """Queue documents for insertion; returns how many were accepted before BufferFull"""
+        self.__ensure_started()
+        accepted = 0
+        deadline = time.monotonic() + timeout
+        with self.__cond:
+            for document in documents:
+                while len(self.__pending) >= self.__max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self.__stopping:
+                        raise BufferFull(accepted)
+                    self.__cond.wait(remaining)
+                self.__pending.append(document)
+                accepted += 1
+                if len(self.__pending) >= self.__batch_size:
+                    self.__cond.notify_all()
+        return accepted
+
+    def stats(self):
+        with self.__cond:
+            return dict(self.__stats, pending=len(self.__pending))
+
+    def close(self):
+        """Stop accepting points and flush whatever is still pending"""
+        with self.__cond:
+            self.__stopping = True
+            self.__cond.notify_all()
+        if self.__flusher is not None:
+            self.__flusher.join(timeout=30)
+
+    def __ensure_started(self):
+        # Started on first use so the thread is created in the serving process
+        with self.__start_lock:
+            if self.__flusher is None:
+                self.__flusher = Thread(target=self.__flush_loop, name="trail-buffer", daemon=True)
+                self.__flusher.start()
+                atexit.register(self.close)
+
+    def __flush_loop(self):
+        while True:
+            with self.__cond:
+                deadline = time.monotonic() + self.__flush_interval
+                while len(self.__pending) < self.__batch_size and not self.__stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__cond.wait(remaining)
+
+                if not self.__pending and self.__stopping:
+                    return
+                batch = [self.__pending.popleft()
+                         for _ in range(min(self.__batch_size, len(self.__pending)))]
+                # Wake producers waiting for room
+                self.__cond.notify_all()
+
+            if batch:
+                self.__write(batch)
+
+    def __write(self, batch):
+        for attempt in range(self.__max_retries):
+            try:
+                self.__collection.insert_many(batch, ordered=False)
+                with self.__cond:
+                    self.__stats['inserted'] += len(batch)
+                    self.__stats['flushes'] += 1
+                return
+            except BulkWriteError as e:
+                # Per-document failures won't go away on retry; duplicates were
+                # already written by an earlier attempt
+                errors = (e.details or {}).get('writeErrors', [])
+                lost = sum(1 for error in errors if error.get('code') != 11000)
+                with self.__cond:
+                    self.__stats['inserted'] += len(batch) - lost
+                    self.__stats['dropped'] += lost
+                    self.__stats['flushes'] += 1
+                if lost:
+                    print(f"✗ {lost} trail point(s) rejected by MongoDB")
+                return
+            except Exception as e:
+                print(f"✗ Trail flush failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * 2 ** attempt)
+
+        with self.__cond:
+            self.__stats['dropped'] += len(batch)
+        print(f"✗ Dropped {len(batch)} trail point(s) after {self.__max_retries} attempts")
@@ -8,28 +8,248 @@
 # https://open-meteo.com/
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import time
 from dotenv import load_dotenv
-from web_scaper.PanahonScraper import PanahonScraperPlaywright as PanahonScraper
+from web_scaper.PanahonScraper import PanahonScraperPlaywright as PanahonScraper, ALERT_TYPES
+from web_scaper.browser_pool import get_shared_pool
+from handlers.cache_handler import TTLCache, normalize_location
+from handlers.advisory_store import AdvisorySnapshotStore
+from handlers.rate_limit import UpstreamGuard, CircuitOpen, RateLimited
+from handlers.mongo_handler import get_database
+from handlers import metrics
 
 load_dotenv()
 
 WEATHER_API = os.getenv("WEATHER_API")
+# Overridable so benchmarks can use a local stand-in
+WEATHERAPI_BASE_URL = os.getenv("WEATHERAPI_BASE_URL", "http://api.weatherapi.com/v1").rstrip("/")
+
+# (connect, read) timeouts so one slow call can't hang a worker pass
+WEATHERAPI_TIMEOUT = (
+    float(os.getenv("WEATHERAPI_CONNECT_TIMEOUT", 3.05)),
+    float(os.getenv("WEATHERAPI_READ_TIMEOUT", 10))
+)
+
+
+def build_session():
+    """
+    Keep-alive session shared by every WeatherHandler.
+    Retries 429/5xx with exponential backoff and honours Retry-After;
+    403 (quota exceeded on WeatherAPI) is never retried.
+    """
+    retry = Retry(
+        total=int(os.getenv("WEATHERAPI_RETRIES", 3)),
+        backoff_factor=float(os.getenv("WEATHERAPI_BACKOFF", 0.5)),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    pool_size = int(os.getenv("WEATHERAPI_POOL_SIZE", 10))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+http_session = build_session()
+
+# Per-upstream rate limit and circuit breaker. WeatherAPI calls are already
+# retried by the session, so the guard adds none; a failed Panahon scrape is
+# retried once after a backoff. While a circuit is open calls fail at once
+# instead of each one waiting out its own timeouts.
+weatherapi_guard = UpstreamGuard(
+    "WeatherAPI",
+    rate=float(os.getenv("WEATHERAPI_RATE_PER_SECOND", 10)),
+    burst=int(os.getenv("WEATHERAPI_BURST", 20)),
+    failure_threshold=int(os.getenv("WEATHERAPI_BREAKER_FAILURES", 5)),
+    reset_timeout=float(os.getenv("WEATHERAPI_BREAKER_RESET", 30))
+)
+panahon_guard = UpstreamGuard(
+    "Panahon",
+    rate=float(os.getenv("PANAHON_RATE_PER_MINUTE", 30)) / 60,
+    burst=int(os.getenv("PANAHON_BURST", 4)),
+    failure_threshold=int(os.getenv("PANAHON_BREAKER_FAILURES", 3)),
+    reset_timeout=float(os.getenv("PANAHON_BREAKER_RESET", 120)),
+    retries=int(os.getenv("PANAHON_RETRIES", 1)),
+    base_backoff=float(os.getenv("PANAHON_RETRY_BACKOFF", 2)),
+    acquire_timeout=float(os.getenv("PANAHON_RATE_WAIT", 30))
+)
+# Locations per batched Panahon scrape; each batch gets its own time budget
+PANAHON_BATCH_SIZE = max(1, int(os.getenv("PANAHON_BATCH_SIZE", 8)))
+
+
+def http_stats():
+    """Connection reuse counters summed over the session's connection pools"""
+    connections = 0
+    request_count = 0
+    # http:// and https:// share one adapter
+    for adapter in set(http_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            request_count += pool.num_requests
+    return {
+        'connections_opened': connections,
+        'requests': request_count,
+        'connections_reused': max(0, request_count - connections)
+    }
+
+# Panahon advisories change on a scale of tens of minutes, so scrapes are
+# shared per location across requests (and across WeatherHandler instances)
+advisory_cache = TTLCache(
+    ttl=int(os.getenv("PANAHON_CACHE_TTL", 600)),
+    stale_ttl=int(os.getenv("PANAHON_CACHE_STALE", 1800)),
+    max_entries=int(os.getenv("PANAHON_CACHE_SIZE", 256)),
+    name="panahon_advisory"
+)
+
+# get_coordinates_info and get_current_forecast read the same current.json
+# response; keep it for a few minutes per ~1 km rounded coordinate
+WEATHERAPI_CACHE_DECIMALS = int(os.getenv("WEATHERAPI_CACHE_DECIMALS", 2))
+current_cache = TTLCache(
+    ttl=int(os.getenv("WEATHERAPI_CACHE_TTL", 300)),
+    max_entries=int(os.getenv("WEATHERAPI_CACHE_SIZE", 1024)),
+    name="weatherapi_current"
+)
+
+# Latest scraped advisory per location and alert type, shared through MongoDB:
+# the worker keeps it current, so the API seldom has to open a browser
+snapshot_store = AdvisorySnapshotStore(
+    lambda: get_database()[os.getenv("ADVISORY_SNAPSHOTS", "advisory_snapshots")],
+    ALERT_TYPES,
+    max_age=int(os.getenv("ADVISORY_SNAPSHOT_MAX_AGE", 1800))
+)
+
+EMPTY_ADVISORY = {
+    'Rainfall': None,
+    'Thunderstorm': None,
+    'Flood': None,
+    'Tropical': None
+}
 
 class WeatherHandler:
     def __init__(self):
         # self.open_meteo_base = 'https://api.open-meteo.com/v1/forecast'
-        self.weatherapi_base_alert =  'http://api.weatherapi.com/v1/alerts.json'
-        self.weatherapi_base_forecast = 'http://api.weatherapi.com/v1/forecast.json'
-        self.weatherapi_base_current_forecast = 'http://api.weatherapi.com/v1/current.json'
-        self.weatherapi_base_search = 'http://api.weatherapi.com/v1/search.json'
+        self.weatherapi_base_alert = f'{WEATHERAPI_BASE_URL}/alerts.json'
+        self.weatherapi_base_forecast = f'{WEATHERAPI_BASE_URL}/forecast.json'
+        self.weatherapi_base_current_forecast = f'{WEATHERAPI_BASE_URL}/current.json'
+        self.weatherapi_base_search = f'{WEATHERAPI_BASE_URL}/search.json'
 
         self.windy_api_base = "https://api.windy.com/api/point-forecast/v2"
 
+    def load_panahon_advisory(self, location):
+        """Advisory from the in-process cache, then a fresh snapshot, then a live scrape; raises if all fail"""
+        advisory = self.get_cached_panahon_advisory(location)
+        if advisory is not None:
+            return advisory
+        return advisory_cache.get_or_load(
+            normalize_location(location),
+            lambda: self.__scrape_panahon(location)
+        )
+
     def get_panahon_advisory(self, location):
-        panahon = PanahonScraper()
-        panahon.start_scraping(location=location)
-        return panahon.get_data()
+        """Like load_panahon_advisory, but an empty advisory when it fails"""
+        try:
+            return self.load_panahon_advisory(location)
+        except Exception as e:
+            print(f"Panahon advisory unavailable for {location}: {e}")
+            return dict(EMPTY_ADVISORY)
+
+    def get_cached_panahon_advisory(self, location):
+        """Fresh cached or snapshotted advisory for location, or None; never scrapes"""
+        key = normalize_location(location)
+        cached = advisory_cache.get(key)
+        if cached is not None:
+            return cached
+        found = self.__read_snapshot(location)
+        if found is None:
+            return None
+        snapshot, fetched_at = found
+        # Only for what is left of the snapshot's own lifetime, not a fresh TTL
+        advisory_cache.put(key, snapshot, ttl=snapshot_store.expires_in(fetched_at))
+        return snapshot
+
+    def get_panahon_advisories(self, locations, fill_missing=True):
+        """
+        Advisories for several locations: cached ones are reused and misses
+        are resolved in batched scrapes of at most PANAHON_BATCH_SIZE locations.
+        Returns {location: advisory}. Locations whose scrape failed get an
+        empty advisory, or are left out when fill_missing is False.
+        """
+        results = {}
+        misses = []
+        for location in locations:
+            cached = advisory_cache.get(normalize_location(location))
+            if cached is not None:
+                results[location] = cached
+            else:
+                misses.append(location)
+
+        if not misses:
+            return results
+
+        panahon = PanahonScraper(pool=get_shared_pool())
+        scraped = {}
+        # Bounded batches, so one failure or timeout only costs its own locations
+        for start in range(0, len(misses), PANAHON_BATCH_SIZE):
+            batch = misses[start:start + PANAHON_BATCH_SIZE]
+            try:
+                found = panahon_guard.call(lambda: panahon.scrape_many(batch), is_failure=lambda result: not result)
+            except (CircuitOpen, RateLimited) as e:
+                print(f"Skipping Panahon scrape of {len(misses) - start} location(s): {e}")
+                break
+            self.__save_snapshots(found)
+            scraped.update(found)
+
+        for location in misses:
+            data = scraped.get(location)
+            if data:
+                advisory_cache.put(normalize_location(location), data)
+                results[location] = data
+            elif fill_missing:
+                print(f"Panahon advisory unavailable for {location}")
+                results[location] = dict(EMPTY_ADVISORY)
+        return results
+
+    def __scrape_panahon(self, location):
+        panahon = PanahonScraper(pool=get_shared_pool())
+
+        def scrape():
+            panahon.start_scraping(location=location)
+            return panahon.has_data()
+
+        panahon_guard.call(scrape, is_failure=lambda scraped: not scraped)
+        if not panahon.has_data():
+            # Don't cache a failed scrape as "no advisories"
+            raise RuntimeError("Panahon scrape failed")
+        data = panahon.get_data()
+        self.__save_snapshots({location: data})
+        return data
+
+    def __read_snapshot(self, location):
+        try:
+            found = snapshot_store.latest(location)
+        except Exception as e:
+            # Snapshots are an optimisation; without MongoDB we simply scrape
+            print(f"Advisory snapshot unavailable for {location}: {e}")
+            return None
+        metrics.CACHE_LOOKUPS.inc(cache="advisory_snapshot", result="miss" if found is None else "hit")
+        return found
+
+    def __save_snapshots(self, advisories):
+        try:
+            snapshot_store.save(advisories)
+        except Exception as e:
+            print(f"Could not save advisory snapshots: {e}")
 
     #
     #
@@ -40,47 +260,65 @@ class WeatherHandler:
     For weather api
     """
 
-    def get_current_forecast(self, lat=13.147298, lng= 123.731476):
+    def get_location_and_current(self, lat=13.147298, lng=123.731476):
+        """
+        Raw current.json response ({'location': ..., 'current': ...}) for a point.
+        One request serves both the location and the current conditions, and
+        responses are cached briefly per rounded coordinate.
+        """
+        key = (round(float(lat), WEATHERAPI_CACHE_DECIMALS), round(float(lng), WEATHERAPI_CACHE_DECIMALS))
+        return current_cache.get_or_load(key, lambda: self.__fetch_current(lat, lng))
+
+    def __fetch_current(self, lat, lng):
         params = {
             'key': WEATHER_API,
             'q': f"{lat},{lng}"
         }
-        try:
-            response = requests.get(self.weatherapi_base_current_forecast, params=params)
-            response.raise_for_status()
-            data = response.json()
+        response = weatherapi_guard.call(lambda: self.__get_current(params))
+        data = response.json()
 
-            # Check if 'current' key exists
-            if 'current' not in data:
-                print(f"Warning: 'current' key not found in response: {data}")
-                return None
+        # Don't cache partial responses
+        for key in ('location', 'current'):
+            if key not in data:
+                raise KeyError(f"'{key}' key not found in response: {data}")
+        return data
 
-            return data['current']
+    def __get_current(self, params):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = http_session.get(
+                self.weatherapi_base_current_forecast,
+                params=params,
+                timeout=WEATHERAPI_TIMEOUT
+            )
+            outcome = str(response.status_code)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.WEATHERAPI_REQUEST_SECONDS.observe(elapsed, endpoint="current", outcome=outcome)
+            metrics.log_event("weatherapi_request", endpoint="current", outcome=outcome,
+                              seconds=round(elapsed, 4))
+        # Raised inside the guard so 429s, 5xx and quota errors count against the circuit
+        response.raise_for_status()
+        return response
+
+    def get_current_forecast(self, lat=13.147298, lng= 123.731476):
+        try:
+            return self.get_location_and_current(lat, lng)['current']
 
         except requests.exceptions.RequestException as e:
             print(f"API Error: {e}")
             return None
+        except (CircuitOpen, RateLimited) as e:
+            print(f"API skipped: {e}")
+            return None
         except KeyError as e:
             print(f"Data parsing error: {e}")
             return None
 
     def get_coordinates_info(self, lat=13.147298, long= 123.731476):
-        params = {
-            'key': WEATHER_API,
-            'q': f"{lat},{long}"
-        }
-
         try:
-            response = requests.get(self.weatherapi_base_current_forecast, params=params)
-            response.raise_for_status()  # ✅ Add this to catch HTTP errors
-            data = response.json()
-
-            # Check if location exists
-            if 'location' not in data:
-                print(f"Warning: 'location' key not found in response")
-                return None
-
-            location = data['location']
+            location = self.get_location_and_current(lat, long)['location']
             return {
                 'name': location.get('name', 'Unknown'),
                 'region': location.get('region', 'Unknown'),
@@ -93,4 +331,3 @@ class WeatherHandler:
         except Exception as e:
             print(f"Error: {e}")
             return None
-
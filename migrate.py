@@ -0,0 +1,23 @@
+"""
+One-off migration for existing data:
+- event_log.time_stamp ISO strings become BSON dates
+- trail points without created_at get one, so TRAIL_RETENTION_DAYS applies to them
+- indexes are created (the app also does this on start-up)
+
+Run with: python migrate.py
+"""
+from handlers.mongo_handler import (get_database, close_client, ensure_indexes,
+                                    migrate_event_timestamps, backfill_trail_created_at)
+import os
+
+
+if __name__ == "__main__":
+    try:
+        geo_db = get_database()
+        converted = migrate_event_timestamps(geo_db[os.getenv("EVENT_LOG")])
+        print(f"✓ Converted {converted} event_log timestamp(s) to dates")
+        backfilled = backfill_trail_created_at(geo_db[os.getenv("MONGODB_COLLECTION")])
+        print(f"✓ Backfilled created_at on {backfilled} trail point(s)")
+        ensure_indexes(geo_db)
+    finally:
+        close_client()
@@ -0,0 +1,24 @@
+from web_scaper.advisory_index import AdvisoryIndex
+
+
+def make_index():
+    index = AdvisoryIndex(ttl=600)
+    index.load({'Rainfall': [
+        {'name': "Samar", 'level': "Yellow"},
+        {'name': "Camarines Sur", 'level': "Orange"},
+        {'name': "Davao", 'level': "Red"}
+    ]})
+    return index
+
+
+def test_lookup_matches_whole_comma_separated_parts():
+    index = make_index()
+    assert "Orange" in index.lookup("Naga, Camarines Sur", 'Rainfall')
+    assert "Yellow" in index.lookup("Samar", 'Rainfall')
+
+
+def test_lookup_never_matches_part_of_an_area_name():
+    index = make_index()
+    assert index.lookup("Northern Samar", 'Rainfall') is None
+    assert index.lookup("Eastern Samar", 'Rainfall') is None
+    assert index.lookup("Davao del Sur", 'Rainfall') is None
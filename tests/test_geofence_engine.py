@@ -0,0 +1,49 @@
+from handlers.geofence_engine import GeofenceEngine, MemoryMembership
+
+
+class FakeCollection:
+    def __init__(self, documents=(), meta=None):
+        self.documents = list(documents)
+        self.meta = meta
+
+    def find(self, query, projection=None):
+        return iter(self.documents)
+
+    def find_one(self, query):
+        return self.meta
+
+
+def square_fence(fence_id, name, lng, lat, half_side=0.01):
+    return {
+        '_id': fence_id,
+        'geometry': {'type': "Polygon", 'coordinates': [[
+            [lng - half_side, lat - half_side], [lng + half_side, lat - half_side],
+            [lng + half_side, lat + half_side], [lng - half_side, lat + half_side],
+            [lng - half_side, lat - half_side]
+        ]]},
+        'properties': {'name': name}
+    }
+
+
+def test_memory_membership_swap_returns_previous_and_evicts_oldest():
+    membership = MemoryMembership(max_users=1)
+    assert membership.swap("a", {1: "Fence"}) == {}
+    assert membership.swap("a", {}) == {1: "Fence"}
+    membership.swap("b", {2: "Other"})
+    # "a" was evicted to stay within max_users
+    assert membership.swap("a", {}) == {}
+
+
+def test_evaluate_emits_enter_then_exit():
+    engine = GeofenceEngine(FakeCollection([square_fence(1, "Naga", 123.18, 13.62)]),
+                            FakeCollection(meta={'version': 1}))
+    engine.reload()
+
+    events = engine.evaluate("user", [(123.18, 13.62, "t1")])
+    assert [(e['event'], e['fence_name'], e['time_stamp']) for e in events] == [('enter', "Naga", "t1")]
+
+    # Still inside: nothing new
+    assert engine.evaluate("user", [(123.181, 13.621, "t2")]) == []
+
+    events = engine.evaluate("user", [(124.0, 14.0, "t3")])
+    assert [(e['event'], e['fence_name']) for e in events] == [('exit', "Naga")]
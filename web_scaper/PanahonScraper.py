@@ -1,98 +1,283 @@
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
-import time
+from web_scaper.browser_pool import PANAHON_URL, build_launch_args, open_alert_panel
+from web_scaper.advisory_index import FIND_MAP_JS, LAYER_FEATURES_JS, shared_index
+from handlers import metrics
+import contextvars
+import os
 import platform
+import time
+
+ALERT_TYPES = ['Rainfall', 'Thunderstorm', 'Flood', 'Tropical']
+
+# Resolves with the popup text once it is visible and no longer "Loading..."
+POPUP_READY_JS = """
+() => {
+    const el = document.querySelector('.ol-popup-content');
+    if (!el || el.offsetParent === null) return false;
+    const text = el.innerText.trim();
+    return text && text !== 'Loading...' ? el.innerText : false;
+}
+"""
+
+# Forget the previous location's popup so the next wait can't match stale text
+POPUP_RESET_JS = """
+() => {
+    const el = document.querySelector('.ol-popup-content');
+    if (el) el.innerHTML = '';
+}
+"""
+
+# Like LAYER_FEATURES_JS but only resolves once the layer has features
+LAYER_READY_JS = f"""
+() => {{
+    const features = ({LAYER_FEATURES_JS})();
+    return features && features.length ? features : false;
+}}
+"""
+
+
+# An empty layer that hasn't reported a finished load counts as settled only after this long;
+# also the fixed wait after showing a layer when the map can't be inspected
+LAYER_SETTLE_MS = 2000
+
+# Run before each show: starts a fresh settle state and counts feature loads in flight
+# on every vector source (OpenLayers' featuresloadstart/featuresloadend events)
+LAYER_SETTLE_RESET_JS = f"""
+() => {{
+    window.__panahonLayer = {{ count: undefined, pending: 0, loaded: 0, since: performance.now() }};
+    const map = ({FIND_MAP_JS})();
+    if (!map) return;
+    const watch = (layers) => layers.forEach((layer) => {{
+        if (typeof layer.getLayers === 'function') return watch(layer.getLayers().getArray());
+        const source = typeof layer.getSource === 'function' ? layer.getSource() : null;
+        if (!source || typeof source.on !== 'function' || source.__panahonWatched) return;
+        source.__panahonWatched = true;
+        const done = () => {{
+            const state = window.__panahonLayer;
+            state.pending = Math.max(0, state.pending - 1);
+            state.loaded += 1;
+        }};
+        source.on('featuresloadstart', () => {{ window.__panahonLayer.pending += 1; }});
+        source.on('featuresloadend', done);
+        source.on('featuresloaderror', done);
+    }});
+    watch(map.getLayers().getArray());
+}}
+"""
+
+# Resolves once no load is in flight and the shown layers' feature count is the same on
+# two polls in a row. Zero features only count once a load has finished or LAYER_SETTLE_MS
+# has passed, since a layer that is still loading also shows none. "no-map" without a map.
+LAYER_SETTLED_JS = f"""
+() => {{
+    const features = ({LAYER_FEATURES_JS})();
+    if (features === null) return 'no-map';
+    const state = window.__panahonLayer;
+    if (!state) return false;
+    const stable = state.count === features.length;
+    state.count = features.length;
+    if (!stable || state.pending > 0) return false;
+    return features.length > 0 || state.loaded > 0 || performance.now() - state.since >= {LAYER_SETTLE_MS};
+}}
+"""
 
 
 class PanahonScraperPlaywright:
     """Playwright-based scraper - more reliable for cloud deployment"""
 
-    def __init__(self):
-        self.__panahon_url = "https://www.panahon.gov.ph/"
+    def __init__(self, pool=None):
+        self.__panahon_url = PANAHON_URL
         self.__data = {}
+        # Optional PanahonBrowserPool; without one every scrape boots its own browser
+        self.__pool = pool
+        self.__popup_timeout = int(os.getenv("PANAHON_POPUP_TIMEOUT_MS", 15000))
+        # "popup" searches each location; "layer" reads whole advisory layers into an index
+        self.__mode = os.getenv("PANAHON_SCRAPE_MODE", "popup")
+        self.__layer_timeout = int(os.getenv("PANAHON_LAYER_TIMEOUT_MS", 10000))
+        # Time budget of one scrape: a fixed part plus, per location, a popup wait per alert type
+        self.__timeout_base = float(os.getenv("PANAHON_SCRAPE_TIMEOUT", 60))
+        self.__timeout_per_location = float(os.getenv(
+            "PANAHON_SCRAPE_TIMEOUT_PER_LOCATION", len(ALERT_TYPES) * self.__popup_timeout / 1000))
 
     def start_scraping(self, location):
+        results = self.scrape_many([location])
+        self.__data = results.get(location, {})
+
+    def scrape_many(self, locations):
+        """
+        Scrape every alert type for a set of locations in one page session.
+        Each alert layer is shown once and all locations are searched against it.
+        Returns {location: {alert_type: content}}, or {} if the scrape failed.
+        """
+        # Dedupe while keeping order
+        locations = list(dict.fromkeys(locations))
+        if not locations:
+            return {}
+
+        if self.__mode == "layer" and shared_index.is_fresh(ALERT_TYPES):
+            print(f"🗂️ Answering {len(locations)} location(s) from the advisory index")
+            metrics.PANAHON_SCRAPES.inc(outcome="index")
+            return {
+                location: {name: shared_index.lookup(location, name) for name in ALERT_TYPES}
+                for location in locations
+            }
+
+        print(f"🗺️ Scraping {len(locations)} location(s)")
+        started = time.perf_counter()
+        timeout = self.__timeout_base + self.__timeout_per_location * len(locations)
+        # The scrape stops itself at the deadline so a timed-out task doesn't keep holding a pooled page
+        deadline = time.monotonic() + timeout
+        results = self.__run(lambda page: self.__scrape_alerts(page, locations, deadline), timeout)
+        outcome = "ok" if results else "failed"
+        metrics.PANAHON_SCRAPES.inc(outcome=outcome)
+        metrics.log_event("panahon_scrape", outcome=outcome, locations=len(locations),
+                          pooled=self.__pool is not None, seconds=round(time.perf_counter() - started, 3))
+        return results or {}
+
+    def __run(self, task, timeout):
+        """Run task(page) on a pooled page or on a one-off browser"""
+        if self.__pool is not None:
+            # Carry the caller's trace id onto the pool thread
+            context = contextvars.copy_context()
+            try:
+                return self.__pool.run(lambda page: context.run(task, page), timeout=timeout)
+            except Exception as e:
+                print(f"❌ Error during scraping: {str(e)}")
+                import traceback
+                traceback.print_exc()
+            return None
+
+        # Imported on first use so importing the scraper doesn't load Playwright
+        from playwright.sync_api import sync_playwright
+
         browser = None
         context = None
         try:
             with sync_playwright() as p:
                 print("🚀 Launching browser...")
 
-                # Different args for Windows vs Linux
-                launch_args = [
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu'
-                ]
-
-                # Only add --single-process on Linux (for Railway)
                 if platform.system() != "Windows":
-                    launch_args.append('--single-process')
                     print("🐧 Running on Linux/Cloud")
                 else:
                     print("🪟 Running on Windows")
 
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=launch_args
-                )
+                with metrics.PANAHON_BROWSER_LAUNCH_SECONDS.time(mode="cold"):
+                    browser = p.chromium.launch(
+                        headless=True,
+                        args=build_launch_args()
+                    )
+
+                    context = browser.new_context(
+                        viewport={'width': 1920, 'height': 1080}
+                    )
+                    page = context.new_page()
 
-                context = browser.new_context(
-                    viewport={'width': 1920, 'height': 1080}
-                )
-                page = context.new_page()
+                with metrics.PANAHON_PAGE_LOAD_SECONDS.time(mode="cold"):
+                    open_alert_panel(page, self.__panahon_url)
+                return task(page)
 
-                print(f"🌐 Navigating to {self.__panahon_url}")
-                page.goto(self.__panahon_url, wait_until="networkidle", timeout=60000)
-                print("✅ Page loaded")
+        except Exception as e:
+            print(f"❌ Error during scraping: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
 
-                # Click notification button
-                print("🔔 Clicking notification button...")
-                page.click("button.notification-button", timeout=10000)
+        finally:
+            # Proper cleanup
+            try:
+                if context:
+                    context.close()
+                if browser:
+                    browser.close()
+                print("🔒 Browser closed")
+            except:
+                pass
 
-                # Wait for show button
-                page.wait_for_selector("#showSelectedAlertBtn", timeout=10000)
+    def __scrape_alerts(self, page, locations, deadline):
+        """Search every location on each alert layer of a page already showing the alert panel"""
+        data = {location: {} for location in locations}
+        layer_features = {}
+        search_input = page.locator("input[placeholder*='Search'], input[type='search']").first
 
-                names = ['Rainfall', 'Thunderstorm', 'Flood', 'Tropical']
+        for i, name in enumerate(ALERT_TYPES):
+            self.__check_deadline(deadline)
+            print(f"\n📊 Processing {name}...")
 
-                for i in range(4):
-                    print(f"\n📊 Processing {names[i]}...")
+            # Select alert type and show its layer once for all locations
+            page.select_option("#alertTypeSelect", index=i)
+            page.evaluate(LAYER_SETTLE_RESET_JS)
+            page.click("#showSelectedAlertBtn")
 
-                    # Select alert type
-                    page.select_option("#alertTypeSelect", index=i)
+            if self.__mode == "layer":
+                with metrics.PANAHON_SCRAPE_STAGE_SECONDS.time(stage="layer", alert_type=name):
+                    features = self.__extract_layer(page)
+                if features is not None:
+                    layer_features[name] = features
+                    print(f"   Layer: {len(features)} feature(s)")
+                    continue
+                print("   Layer unavailable, searching locations instead")
+            else:
+                # Searching before the layer has rendered finds nothing
+                self.__wait_for_layer(page)
 
-                    # Click show button
-                    page.click("#showSelectedAlertBtn")
-                    time.sleep(2)
+            for location in locations:
+                self.__check_deadline(deadline)
+                with metrics.PANAHON_SCRAPE_STAGE_SECONDS.time(stage="popup", alert_type=name):
+                    page.evaluate(POPUP_RESET_JS)
 
                     # Search for location
-                    search_input = page.locator("input[placeholder*='Search'], input[type='search']").first
                     search_input.clear()
                     search_input.fill(location)
                     search_input.press("Enter")
-                    time.sleep(3)
 
                     # Extract content
                     content = self.__wait_and_extract_content(page)
-                    self.__data[names[i]] = content
-                    print(f"   Result: {'✅ Found' if content else '❌ None'}")
+                data[location][name] = content
+                print(f"   {location}: {'✅ Found' if content else '❌ None'}")
+
+        if layer_features:
+            shared_index.load(layer_features)
+            for location in locations:
+                for name in layer_features:
+                    data[location][name] = shared_index.lookup(location, name)
+
+        print(f"\n✅ Scraping complete!")
+        return data
+
+    def __check_deadline(self, deadline):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Panahon scrape ran past its deadline")
 
-                print(f"\n✅ Scraping complete!")
+    def __wait_for_layer(self, page):
+        """Wait until the shown advisory layer has finished loading its features"""
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
+        try:
+            handle = page.wait_for_function(LAYER_SETTLED_JS, polling=250, timeout=self.__layer_timeout)
+            if handle.json_value() != 'no-map':
+                return
+        except PlaywrightTimeout:
+            print("   ⏱️ Layer still changing, searching anyway")
+            return
+        page.wait_for_timeout(LAYER_SETTLE_MS)
 
+    def __extract_layer(self, page):
+        """
+        Read every feature of the shown advisory layer from the OpenLayers map.
+        Returns [] when the layer is empty, or None when no map could be found.
+        """
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
+        try:
+            handle = page.wait_for_function(LAYER_READY_JS, timeout=self.__layer_timeout)
+            return handle.json_value()
+        except PlaywrightTimeout:
+            # Map present but no features means no advisories of this type
+            return page.evaluate(LAYER_FEATURES_JS)
         except Exception as e:
-            print(f"❌ Error during scraping: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            print(f"   ⚠️ Error reading advisory layer: {e}")
+            return None
 
-        finally:
-            # Proper cleanup
-            try:
-                if context:
-                    context.close()
-                if browser:
-                    browser.close()
-                print("🔒 Browser closed")
-            except:
-                pass
+    def has_data(self):
+        """True when the last scrape completed"""
+        return bool(self.__data)
 
     def get_data(self):
         """Return scraped data or empty structure if failed"""
@@ -105,25 +290,12 @@ class PanahonScraperPlaywright:
             }
         return self.__data
 
-    def __wait_and_extract_content(self, page, timeout=15000):
+    def __wait_and_extract_content(self, page):
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
         try:
-            time.sleep(2)
-
-            # Wait for popup to be visible
-            page.wait_for_selector(".ol-popup-content", state="visible", timeout=timeout)
-
-            # Get popup content
-            popup = page.locator(".ol-popup-content").first
-
-            # Wait until content is not "Loading..."
-            max_attempts = 15
-            for _ in range(max_attempts):
-                content = popup.inner_text()
-                if content and content.strip() and content.strip() != "Loading...":
-                    return content
-                time.sleep(1)
-
-            return None
+            # Wait for the popup to show real content instead of sleeping
+            handle = page.wait_for_function(POPUP_READY_JS, timeout=self.__popup_timeout)
+            return handle.json_value()
 
         except PlaywrightTimeout:
             print("   ⏱️ Timeout: Content didn't load")
@@ -131,4 +303,3 @@ class PanahonScraperPlaywright:
         except Exception as e:
             print(f"   ⚠️ Error extracting content: {e}")
             return None
-
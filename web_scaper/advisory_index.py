@@ -0,0 +1,123 @@
+from threading import Lock
+import os
+import re
+import time
+
+# Feature properties that usually carry the area name on the advisory layers
+NAME_KEYS = (
+    'name', 'area', 'location', 'province', 'municipality', 'city', 'region',
+    'adm1_en', 'adm2_en', 'adm3_en', 'prov_name', 'mun_name'
+)
+
+# The page's OpenLayers map object, or null when there is none
+FIND_MAP_JS = """
+() => {
+    const isMap = (o) => o && typeof o.getLayers === 'function' && typeof o.getView === 'function';
+    if (isMap(window.map)) return window.map;
+    for (const key of Object.keys(window)) {
+        try {
+            if (isMap(window[key])) return window[key];
+        } catch (e) {}
+    }
+    return null;
+}
+"""
+
+# Resolves with the features of every vector layer on the OpenLayers map.
+# Returns null when no map object can be found on the page at all.
+LAYER_FEATURES_JS = f"""
+() => {{
+    const map = ({FIND_MAP_JS})();
+    if (!map) return null;
+
+    const features = [];
+    const walk = (layers) => layers.forEach((layer) => {{
+        if (typeof layer.getLayers === 'function') return walk(layer.getLayers().getArray());
+        if (typeof layer.getVisible === 'function' && !layer.getVisible()) return;
+        const source = typeof layer.getSource === 'function' ? layer.getSource() : null;
+        if (!source || typeof source.getFeatures !== 'function') return;
+        source.getFeatures().forEach((feature) => {{
+            const props = {{}};
+            const all = feature.getProperties();
+            for (const key of Object.keys(all)) {{
+                const value = all[key];
+                if (value === null || ['string', 'number', 'boolean'].includes(typeof value)) {{
+                    props[key] = value;
+                }}
+            }}
+            features.push(props);
+        }});
+    }});
+    walk(map.getLayers().getArray());
+    return features;
+}}
+"""
+
+
+def normalize_area(name):
+    """Loose area key: lowercase words without punctuation or 'province'/'city of'"""
+    name = re.sub(r"[^\w\s]", " ", str(name).casefold())
+    name = re.sub(r"\b(province of|province|city of|municipality of)\b", " ", name)
+    return " ".join(name.split())
+
+
+def feature_text(properties):
+    """Render feature properties the way the popup lists them"""
+    return "\n".join(f"{key}: {value}" for key, value in properties.items() if value not in (None, ""))
+
+
+class AdvisoryIndex:
+    """
+    In-memory area -> advisory index built from whole advisory layers.
+    Once loaded, answering a location is a dictionary lookup instead of a
+    browser search.
+    """
+
+    def __init__(self, ttl=600):
+        self.__ttl = ttl
+        self.__layers = {}  # alert_type -> {area_key: advisory text}
+        self.__loaded_at = None
+        self.__lock = Lock()
+
+    def load(self, features_by_type):
+        """Replace the index with {alert_type: [feature properties, ...]}"""
+        layers = {}
+        for alert_type, features in features_by_type.items():
+            areas = {}
+            for properties in features:
+                text = feature_text(properties)
+                for key, value in properties.items():
+                    if key.casefold() in NAME_KEYS and isinstance(value, str) and value.strip():
+                        areas.setdefault(normalize_area(value), text)
+            layers[alert_type] = areas
+
+        with self.__lock:
+            self.__layers = layers
+            self.__loaded_at = time.monotonic()
+        print(f"🗂️ Advisory index loaded: "
+              f"{', '.join(f'{t}={len(a)}' for t, a in layers.items())}")
+
+    def is_fresh(self, alert_types):
+        with self.__lock:
+            if self.__loaded_at is None or time.monotonic() - self.__loaded_at >= self.__ttl:
+                return False
+            return all(alert_type in self.__layers for alert_type in alert_types)
+
+    def lookup(self, location, alert_type):
+        """Advisory text for location on one layer, or None"""
+        key = normalize_area(location)
+        with self.__lock:
+            areas = self.__layers.get(alert_type, {})
+        if key in areas:
+            return areas[key]
+
+        # "Naga, Camarines Sur": try each whole comma-separated part in turn. Never a
+        # substring match, or "Northern Samar" would pick up the advisory for "Samar".
+        for part in str(location).split(","):
+            part = normalize_area(part)
+            if part in areas:
+                return areas[part]
+        return None
+
+
+shared_index = AdvisoryIndex(ttl=int(os.getenv("PANAHON_INDEX_TTL", 600)))
@@ -0,0 +1,262 @@
+from handlers import metrics
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from threading import Thread, Event, Lock
+from dotenv import load_dotenv
+import atexit
+import os
+import platform
+import queue
+import time
+
+load_dotenv()
+
+# Overridable so benchmarks can point the scraper at a local fixture
+PANAHON_URL = os.getenv("PANAHON_URL", "https://www.panahon.gov.ph/")
+
+
+def build_launch_args():
+    """Chromium launch args shared by the pool and the one-shot scraper"""
+    # Different args for Windows vs Linux
+    launch_args = [
+        '--no-sandbox',
+        '--disable-dev-shm-usage',
+        '--disable-gpu'
+    ]
+
+    # Only add --single-process on Linux (for Railway)
+    if platform.system() != "Windows":
+        launch_args.append('--single-process')
+
+    return launch_args
+
+
+def open_alert_panel(page, url=PANAHON_URL):
+    """Load Panahon and open the alert panel so the page is ready for searches"""
+    print(f"🌐 Navigating to {url}")
+    page.goto(url, wait_until="networkidle", timeout=60000)
+    print("✅ Page loaded")
+
+    # Click notification button
+    print("🔔 Clicking notification button...")
+    page.click("button.notification-button", timeout=10000)
+
+    # Wait for show button
+    page.wait_for_selector("#showSelectedAlertBtn", timeout=10000)
+
+
+class BrowserPoolBusy(Exception):
+    """Raised when every warm page is busy and the wait queue is full"""
+
+
+class PanahonBrowserPool:
+    """
+    Long-lived pool of warm Chromium pages parked on the Panahon alert panel.
+
+    Playwright's sync API is bound to the thread that started it, so every
+    slot is a dedicated thread owning one browser and one page. Jobs are
+    callables taking the warm page; at most `size` of them run at once and
+    at most `queue_size` more may wait for a free page. A slot whose page
+    can't be warmed (Panahon down) retries with exponential backoff, up to
+    `max_backoff` seconds, and fails jobs at once until then.
+    """
+
+    def __init__(self, size=2, queue_size=20, max_uses=50, url=PANAHON_URL, base_backoff=5, max_backoff=600):
+        self.__size = size
+        self.__max_uses = max_uses
+        self.__base_backoff = base_backoff
+        self.__max_backoff = max_backoff
+        self.__url = url
+        self.__jobs = queue.Queue(maxsize=queue_size)
+        self.__stopping = Event()
+        self.__workers = []
+        self.__ready = 0
+        self.__lock = Lock()
+
+    def start(self):
+        """Spawn the slot threads; each one warms its page before taking jobs"""
+        for slot in range(self.__size):
+            worker = Thread(
+                target=self.__worker_loop,
+                args=(slot,),
+                name=f"panahon-pool-{slot}",
+                daemon=True
+            )
+            worker.start()
+            self.__workers.append(worker)
+        print(f"🏊 Browser pool started with {self.__size} page(s)")
+
+    def run(self, task, timeout=120):
+        """
+        Run task(page) on a warm page and return its result. On timeout a
+        task still waiting in the queue is dropped; one already running keeps
+        its page until it returns, so long tasks should stop themselves by
+        the same deadline (see PanahonScraperPlaywright.scrape_many).
+        """
+        if self.__stopping.is_set():
+            raise RuntimeError("Browser pool is shut down")
+
+        future = Future()
+        try:
+            self.__jobs.put((task, future, time.perf_counter()), timeout=1)
+        except queue.Full:
+            raise BrowserPoolBusy("All Panahon pages are busy, try again later")
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def ready_count(self):
+        """Number of slots that currently hold a healthy warm page"""
+        with self.__lock:
+            return self.__ready
+
+    def shutdown(self):
+        self.__stopping.set()
+        for _ in self.__workers:
+            try:
+                self.__jobs.put_nowait(None)
+            except queue.Full:
+                break
+        for worker in self.__workers:
+            worker.join(timeout=10)
+        print("🔒 Browser pool closed")
+
+    def __worker_loop(self, slot):
+        # Imported here so the pool module is cheap to import
+        from playwright.sync_api import sync_playwright
+
+        with sync_playwright() as p:
+            browser = None
+            page = None
+            uses = 0
+            # Consecutive failed warm-ups; while Panahon is down, retries back off
+            failures = 0
+            retry_at = 0
+
+            while not self.__stopping.is_set():
+                # Keep a warm page around even while idle
+                if page is None and time.monotonic() >= retry_at:
+                    browser, page = self.__recycle(p, browser, slot)
+                    uses = 0
+                    failures, retry_at = self.__after_warm_up(slot, page, failures)
+
+                try:
+                    item = self.__jobs.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+
+                task, future, enqueued_at = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                metrics.PANAHON_POOL_WAIT_SECONDS.observe(time.perf_counter() - enqueued_at)
+
+                if page is not None and not self.__is_healthy(browser, page):
+                    print(f"🩺 Slot {slot}: page unhealthy, recycling")
+                    self.__mark_not_ready()
+                    page = None
+                    retry_at = 0
+                if page is None and time.monotonic() >= retry_at:
+                    browser, page = self.__recycle(p, browser, slot)
+                    uses = 0
+                    failures, retry_at = self.__after_warm_up(slot, page, failures)
+                if page is None:
+                    # Fail fast while backing off instead of relaunching for every job
+                    future.set_exception(RuntimeError("Could not open Panahon page"))
+                    continue
+
+                try:
+                    future.set_result(task(page))
+                    uses += 1
+                except Exception as e:
+                    future.set_exception(e)
+                    # The page may be in an unknown state after a failed scrape
+                    self.__mark_not_ready()
+                    page = None
+                    continue
+
+                if uses >= self.__max_uses:
+                    print(f"♻️ Slot {slot}: recycling after {uses} scrapes")
+                    self.__mark_not_ready()
+                    page = None
+
+            self.__close(browser)
+
+    def __after_warm_up(self, slot, page, failures):
+        """(failures, retry_at) after a warm-up attempt: exponential backoff while it keeps failing"""
+        if page is not None:
+            return 0, 0
+        failures += 1
+        delay = min(self.__max_backoff, self.__base_backoff * 2 ** (failures - 1))
+        print(f"⏳ Slot {slot}: warm-up failed {failures} time(s), next attempt in {delay:g}s")
+        return failures, time.monotonic() + delay
+
+    def __recycle(self, p, browser, slot):
+        """Close the old browser (if any) and open a fresh warm page"""
+        self.__close(browser)
+        browser = None
+        try:
+            print(f"🚀 Slot {slot}: launching browser...")
+            with metrics.PANAHON_BROWSER_LAUNCH_SECONDS.time(mode="pool"):
+                browser = p.chromium.launch(headless=True, args=build_launch_args())
+                context = browser.new_context(viewport={'width': 1920, 'height': 1080})
+                page = context.new_page()
+            with metrics.PANAHON_PAGE_LOAD_SECONDS.time(mode="pool"):
+                open_alert_panel(page, self.__url)
+            with self.__lock:
+                self.__ready += 1
+            return browser, page
+        except Exception as e:
+            print(f"❌ Slot {slot}: failed to warm page: {e}")
+            self.__close(browser)
+            return None, None
+
+    def __is_healthy(self, browser, page):
+        try:
+            if not browser.is_connected() or page.is_closed():
+                return False
+            return page.evaluate("() => !!document.querySelector('#showSelectedAlertBtn')")
+        except Exception:
+            return False
+
+    def __mark_not_ready(self):
+        with self.__lock:
+            self.__ready = max(0, self.__ready - 1)
+
+    def __close(self, browser):
+        if browser is None:
+            return
+        try:
+            browser.close()
+        except Exception:
+            pass
+
+
+_shared_pool = None
+_shared_pool_lock = Lock()
+
+
+def get_shared_pool():
+    """
+    Process-wide browser pool, started on first use.
+    Returns None when PANAHON_POOL_SIZE is 0 (one browser per scrape).
+    """
+    global _shared_pool
+    size = int(os.getenv("PANAHON_POOL_SIZE", 2))
+    if size <= 0:
+        return None
+
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = PanahonBrowserPool(
+                size=size,
+                queue_size=int(os.getenv("PANAHON_POOL_QUEUE", 20)),
+                max_uses=int(os.getenv("PANAHON_POOL_MAX_USES", 50)),
+                base_backoff=float(os.getenv("PANAHON_POOL_BACKOFF", 5)),
+                max_backoff=float(os.getenv("PANAHON_POOL_MAX_BACKOFF", 600))
+            )
+            _shared_pool.start()
+            atexit.register(_shared_pool.shutdown)
+        return _shared_pool
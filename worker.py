@@ -1,38 +1,104 @@
-from pymongo import MongoClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 from dotenv import load_dotenv
-from handlers.weather_handler import WeatherHandler
+from handlers.weather_handler import WeatherHandler, http_stats
+from handlers.mongo_handler import get_database
+from handlers import metrics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock, BoundedSemaphore
 import os
 import time
 import schedule
 
 load_dotenv()
 
-# MongoDB connection
-try:
-    client = MongoClient(
-        os.getenv("MONGODB_URI"),
-        tlsAllowInvalidCertificates=True
-    )
-    client.admin.command('ping')
-    print("✓ MongoDB connection successful!")
-except Exception as e:
-    print(f"✗ MongoDB connection failed: {e}")
-    raise
-
-geo_db = client[os.getenv("MONGODB_DATABASE")]
+# MongoDB connection; the client connects on first use, so an unreachable
+# database fails a pass (and is retried next pass) instead of killing the worker
+geo_db = get_database()
 drawn_shapes = geo_db.shapes
+# Holds the shapes version the app's geofence engine polls to know when to reload
+fence_meta = geo_db.fence_meta
 weather_info = WeatherHandler()
 
+# Parallelism for one pass, plus a cap per upstream service so a big pass
+# can't flood WeatherAPI or open more Panahon scrapes than the pool serves
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 8))
+weatherapi_slots = BoundedSemaphore(int(os.getenv("WEATHERAPI_CONCURRENCY", 4)))
+panahon_slots = BoundedSemaphore(int(os.getenv("PANAHON_CONCURRENCY", 2)))
+
+# Held for the whole pass so a slow pass is never overlapped by the next one
+pass_lock = Lock()
+
+
+# Shapes whose representative points fall in the same cell share one
+# WeatherAPI lookup; 0.1 degrees is roughly 11 km
+WORKER_GRID_DEG = float(os.getenv("WORKER_GRID_DEG", 0.1))
+
+# Max is_active flips sent in one bulk_write
+WORKER_BULK_BATCH = int(os.getenv("WORKER_BULK_BATCH", 500))
+
+# Shapes fetched per cursor batch, and how often a pass rereads every shape
+# instead of only the ones inserted since the previous pass (1 = always)
+WORKER_CURSOR_BATCH = int(os.getenv("WORKER_CURSOR_BATCH", 500))
+WORKER_FULL_SCAN_EVERY = int(os.getenv("WORKER_FULL_SCAN_EVERY", 10))
+
+# "watch": evaluate inserted and reshaped fences as they change (change
+# stream, or polling _id / modified_at where change streams are unavailable)
+# with a full reconciliation sweep every WORKER_RECONCILE_MINUTES.
+# "schedule": the original sweep every minute.
+WORKER_MODE = os.getenv("WORKER_MODE", "watch")
+WORKER_RECONCILE_MINUTES = float(os.getenv("WORKER_RECONCILE_MINUTES", 15))
+# Changes arriving within this window are evaluated together
+WORKER_CHANGE_WINDOW = float(os.getenv("WORKER_CHANGE_WINDOW", 2))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", 5))
+
+# Adaptive refresh per grid cell: a cell with an active fence is rechecked
+# every WORKER_REFRESH_MIN_MINUTES; each quiet check doubles its interval up
+# to WORKER_REFRESH_MAX_MINUTES. Cells whose lookups failed are retried at
+# the minimum interval. Changed shapes are always evaluated immediately.
+WORKER_REFRESH_MIN_MINUTES = float(os.getenv("WORKER_REFRESH_MIN_MINUTES", 5))
+WORKER_REFRESH_MAX_MINUTES = float(os.getenv("WORKER_REFRESH_MAX_MINUTES", 60))
+
+# Prometheus text file rewritten after every pass (e.g. for node_exporter's
+# textfile collector); unset to skip the dump
+WORKER_METRICS_FILE = os.getenv("WORKER_METRICS_FILE")
+
+# Change stream events worth a re-evaluation: new, replaced or deleted shapes
+# and geometry edits. The worker's own is_active flips are filtered out here.
+SHAPE_CHANGES = [{'$match': {'$or': [
+    {'operationType': {'$in': ['insert', 'replace', 'delete']}},
+    {'operationType': 'update', '$expr': {'$gt': [
+        {'$size': {'$filter': {
+            'input': {'$objectToArray': {'$ifNull': ['$updateDescription.updatedFields', {}]}},
+            'cond': {'$eq': [{'$substrCP': ['$$this.k', 0, 8]}, 'geometry']}
+        }}},
+        0
+    ]}}
+]}}]
+
+# Change streams need a replica set; these codes mean the server can't serve one
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# _id -> projected shape, kept between passes for incremental reads
+shape_catalog = {}
+catalog_state = {'passes': 0, 'last_id': None}
+
+# grid cell -> {'interval': seconds, 'due_at': monotonic time}; guarded by pass_lock
+region_schedule = {}
+
 
 def get_coordinates_info(lat, lng):
-    coordinates_info = weather_info.get_coordinates_info(lat=lat, long=lng)
+    with weatherapi_slots:
+        coordinates_info = weather_info.get_coordinates_info(lat=lat, long=lng)
+    if coordinates_info is None:
+        return None
     return coordinates_info.get("state_province", None)
 
 
-def check_weather_advisory(lat, lng):
-    coordinates_info = get_coordinates_info(lat, lng)
-    panahon_data = weather_info.get_panahon_advisory(coordinates_info)
-    data = [advisory for key, advisory in panahon_data.items() if advisory]
+def check_weather_advisory(panahon_data):
+    data = [advisory for key, advisory in (panahon_data or {}).items() if advisory]
     print(f"data: {data}")
     if len(data) > 0:
         return data
@@ -45,70 +111,427 @@ def check_weather_advisory(lat, lng):
 # Red warning: More than 30 mm in one hour.
 # https://water.usgs.gov/edu/activity-howmuchrain-metric.html#:~:text=Slight%20rain:%20Less%20than%200.5,than%2050%20mm%20per%20hour.
 def check_precipitation(lat, lng):
-    current_weather = weather_info.get_current_forecast(lat, lng)
+    """Current condition and rainfall, or None when WeatherAPI is unavailable"""
+    with weatherapi_slots:
+        current_weather = weather_info.get_current_forecast(lat, lng)
+    if current_weather is None:
+        return None
     return {'weather_condition': current_weather['condition']['text'], 'precipitation': current_weather['precip_mm']}
 
 
+def first_element(array_expr):
+    """Aggregation expression for array[0], or null when the value isn't an array"""
+    return {'$cond': [
+        {'$isArray': array_expr},
+        {'$arrayElemAt': [array_expr, 0]},
+        None
+    ]}
+
+
+def shape_pipeline(after_id=None, ids=None):
+    """
+    Project each shape down to _id, geometry type, its first vertex and
+    is_active on the server, so polygon coordinate arrays never leave MongoDB.
+    """
+    pipeline = []
+    if after_id is not None:
+        pipeline.append({'$match': {'_id': {'$gt': after_id}}})
+    if ids is not None:
+        pipeline.append({'$match': {'_id': {'$in': list(ids)}}})
+    pipeline += [
+        {'$sort': {'_id': 1}},
+        {'$project': {
+            'shape_type': '$geometry.type',
+            'is_active': '$properties.is_active',
+            'point': {'$switch': {
+                'branches': [
+                    {'case': {'$eq': ['$geometry.type', 'Polygon']},
+                     'then': first_element(first_element('$geometry.coordinates'))},
+                    {'case': {'$eq': ['$geometry.type', 'Point']},
+                     'then': '$geometry.coordinates'}
+                ],
+                'default': None
+            }}
+        }}
+    ]
+    return pipeline
+
+
+def load_shapes(force_full=False):
+    """
+    Shapes for this pass, read through a projected, batched cursor.
+    Between full scans only shapes inserted since the last pass are read and
+    the rest come from the in-memory catalog; every WORKER_FULL_SCAN_EVERY
+    passes the catalog is rebuilt to pick up geometry edits and deletions.
+    """
+    full_scan = (
+        force_full
+        or WORKER_FULL_SCAN_EVERY <= 1
+        or catalog_state['last_id'] is None
+        or catalog_state['passes'] % WORKER_FULL_SCAN_EVERY == 0
+    )
+    if full_scan:
+        shape_catalog.clear()
+        catalog_state['last_id'] = None
+
+    cursor = drawn_shapes.aggregate(
+        shape_pipeline(catalog_state['last_id']),
+        batchSize=WORKER_CURSOR_BATCH
+    )
+    read = 0
+    for document in cursor:
+        shape_catalog[document['_id']] = document
+        catalog_state['last_id'] = document['_id']
+        read += 1
+
+    catalog_state['passes'] += 1
+    print(f"Read {read} shape(s) ({'full scan' if full_scan else 'new shapes only'}), "
+          f"{len(shape_catalog)} in catalog")
+    return list(shape_catalog.values())
+
+
+def representative_point(document):
+    """(lat, lng) of the shape's first vertex, or None if the geometry is unusable"""
+    point = document.get('point')
+    if isinstance(point, list) and len(point) >= 2:
+        lng = point[0]  # longitude
+        lat = point[1]  # latitude
+        return lat, lng
+    return None
+
+
+def grid_cell(lat, lng):
+    return round(lat / WORKER_GRID_DEG), round(lng / WORKER_GRID_DEG)
+
+
+def fetch_cell(cell):
+    """Province and current precipitation for the centre of one grid cell"""
+    lat = cell[0] * WORKER_GRID_DEG
+    lng = cell[1] * WORKER_GRID_DEG
+    current_weather = check_precipitation(lat, lng)
+    if current_weather is None:
+        # Without weather the cell can't be decided; its shapes keep their state
+        raise RuntimeError("WeatherAPI unavailable")
+    province = get_coordinates_info(lat, lng)
+    return {'province': province, 'precipitation': current_weather.get('precipitation', 0.0)}
+
+
+def plan_pass(documents):
+    """Group shapes by grid cell: {cell: [(document, lat, lng), ...]}"""
+    cells = {}
+    for document in documents:
+        point = representative_point(document)
+        if point is None:
+            continue
+        lat, lng = point
+        cells.setdefault(grid_cell(lat, lng), []).append((document, lat, lng))
+    return cells
+
+
+def fetch_regions(executor, cells):
+    """One WeatherAPI lookup per cell, then one batched Panahon scrape for the distinct provinces"""
+    cell_info = {}
+    futures = {cell: executor.submit(fetch_cell, cell) for cell in cells}
+    for cell, future in futures.items():
+        try:
+            cell_info[cell] = future.result()
+        except Exception as e:
+            print(f"Error fetching weather for cell {cell}: {str(e)}")
+
+    provinces = {info['province'] for info in cell_info.values() if info['province']}
+    with panahon_slots:
+        # Failed scrapes are left out rather than read as "no advisory"
+        advisories = weather_info.get_panahon_advisories(provinces, fill_missing=False) if provinces else {}
+    return cell_info, advisories
 
-def fence_activation():
-    try:
-        print("Starting fence activation check...")
-        for document in drawn_shapes.find():
-            try:
-                coordinates = document.get('geometry', {}).get('coordinates', [])
-                shape_type = document.get('geometry', {}).get('type', None)
-
-                if coordinates and len(coordinates) > 0:
-                    shape_t = None
-                    if shape_type == "Polygon":
-                        shape_t = coordinates[0]
-                    elif shape_type == "Point":
-                        shape_t = [[coordinates[0], coordinates[1]]]
-
-                    if shape_t and len(shape_t) > 0:
-                        first_coordinate = shape_t[0]
-                        if first_coordinate and len(first_coordinate) >= 2:
-                            lng = first_coordinate[0]  # longitude
-                            lat = first_coordinate[1]  # latitude
-
-                            print(f"Checking shape {document.get('_id')} at coordinates: {lat}, {lng}")
-
-                            # Check for weather advisory
-                            advisory = check_weather_advisory(lat, lng)
-                            current_weather = check_precipitation(lat, lng)
-                            perci_level = current_weather.get('precipitation', 0.0)
-
-                            # Update is_active inside properties based on advisory
-                            if advisory or perci_level > 7.5:  # yellow rainfall warning
-                                drawn_shapes.update_one(
-                                    {'_id': document['_id']},
-                                    {'$set': {'properties.is_active': True}}
-                                )
-                                print(f"✓ Activated fence {document.get('_id')} - Advisory found")
-                            else:
-                                # Deactivate fence if no advisory
-                                drawn_shapes.update_one(
-                                    {'_id': document['_id']},
-                                    {'$set': {'properties.is_active': False}}
-                                )
-                                print(f"✗ Deactivated fence {document.get('_id')} - No advisory")
 
+def should_activate(info, advisory):
+    """A fence is active when its province has an advisory or rain is past the yellow threshold"""
+    perci_level = info['precipitation']
+    return bool(advisory) or perci_level > 7.5  # yellow rainfall warning
+
+
+def apply_changes(updates):
+    """Write is_active flips in unordered bulk batches; returns (changed, failed)"""
+    changed = 0
+    failed = 0
+    for start in range(0, len(updates), WORKER_BULK_BATCH):
+        batch = updates[start:start + WORKER_BULK_BATCH]
+        try:
+            result = drawn_shapes.bulk_write(batch, ordered=False)
+            changed += result.modified_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            changed += details.get('nModified', 0)
+            failed += len(details.get('writeErrors', []))
+            print(f"Bulk write reported {len(details.get('writeErrors', []))} error(s)")
+        except Exception as e:
+            failed += len(batch)
+            print(f"Bulk write failed for {len(batch)} shape(s): {str(e)}")
+    return changed, failed
+
+
+def region_due(cell, now):
+    entry = region_schedule.get(cell)
+    return entry is None or entry['due_at'] <= now
+
+
+def reschedule_region(cell, active, failed, now):
+    """Shrink the cell's interval while alerts are active, grow it while quiet"""
+    minimum = WORKER_REFRESH_MIN_MINUTES * 60
+    maximum = max(minimum, WORKER_REFRESH_MAX_MINUTES * 60)
+    entry = region_schedule.get(cell)
+    if failed or active or entry is None:
+        interval = minimum
+    else:
+        interval = min(maximum, entry['interval'] * 2)
+    region_schedule[cell] = {'interval': interval, 'due_at': now + interval}
+
+
+def evaluate_shapes(documents, force=False):
+    """
+    Decide is_active for projected shapes and write the flips.
+    Unless force is set, shapes in grid cells that aren't due for a refresh
+    are deferred. Returns {changed, unchanged, failed, deferred}; the caller
+    holds pass_lock.
+    """
+    cells = plan_pass(documents)
+    now = time.monotonic()
+    deferred = 0
+    if not force:
+        due = {cell: shapes for cell, shapes in cells.items() if region_due(cell, now)}
+        deferred = sum(len(shapes) for cell, shapes in cells.items() if cell not in due)
+        cells = due
+    shape_count = sum(len(shapes) for shapes in cells.values())
+    print(f"Planned {shape_count} shape(s) across {len(cells)} grid cell(s), {deferred} deferred")
+
+    with ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="fence") as executor:
+        cell_info, advisories = fetch_regions(executor, cells)
+
+    # Check for weather advisory once per province
+    province_advisory = {
+        province: check_weather_advisory(panahon_data)
+        for province, panahon_data in advisories.items()
+    }
+
+    # Fan region results back out to the shapes, queueing only real flips
+    updates = []
+    flips = []
+    unchanged = 0
+    failed = 0
+    for cell, shapes in cells.items():
+        info = cell_info.get(cell)
+        # A province whose scrape failed can't be decided either
+        if info is not None and info['province'] and info['province'] not in advisories:
+            info = None
+        cell_active = False
+        for document, lat, lng in shapes:
+            if info is None:
+                # A failed cell only skips its own shapes
+                failed += 1
+                continue
+            try:
+                is_active = should_activate(info, province_advisory.get(info['province']))
+                cell_active = cell_active or is_active
+                if document.get('is_active') == is_active:
+                    unchanged += 1
+                    continue
+                updates.append(UpdateOne(
+                    {'_id': document['_id'], 'properties.is_active': {'$ne': is_active}},
+                    {'$set': {'properties.is_active': is_active}}
+                ))
+                flips.append((document, is_active))
+                print(f"{'✓ Activated' if is_active else '✗ Deactivated'} fence {document.get('_id')}")
             except Exception as e:
+                failed += 1
                 print(f"Error processing document {document.get('_id')}: {str(e)}")
-                continue
+        reschedule_region(cell, cell_active, info is None, now)
+
+    changed, write_failed = apply_changes(updates)
+    if write_failed:
+        # Unknown which flips landed; reread everything next pass
+        catalog_state['last_id'] = None
+    else:
+        for document, is_active in flips:
+            document['is_active'] = is_active
+    if changed:
+        fence_meta.update_one({'_id': 'shapes'}, {'$inc': {'version': 1}}, upsert=True)
+
+    # Flips that matched nothing were already applied by someone else
+    unchanged += len(updates) - changed - write_failed
+    stats = {'changed': changed, 'unchanged': unchanged, 'failed': failed + write_failed, 'deferred': deferred}
+    for outcome, count in stats.items():
+        metrics.FENCE_SHAPES.inc(count, outcome=outcome)
+    return stats
+
+
+def record_pass(kind, started, stats):
+    """Pass duration as a histogram and a log line, then refresh the metrics dump"""
+    elapsed = time.monotonic() - started
+    metrics.FENCE_PASS_SECONDS.observe(elapsed, kind=kind)
+    metrics.log_event("fence_pass", kind=kind, seconds=round(elapsed, 3), **(stats or {}))
+    try:
+        metrics.dump(WORKER_METRICS_FILE)
+    except OSError as e:
+        print(f"Could not write metrics to {WORKER_METRICS_FILE}: {e}")
 
-        print("Fence activation check completed!")
+
+def fence_activation(force_full=False, force=False):
+    """
+    One sweep: force_full rereads every shape instead of the catalog delta,
+    force evaluates every cell instead of only those due on the adaptive schedule.
+    """
+    if not pass_lock.acquire(blocking=False):
+        print("Previous fence activation pass still running, skipping this one")
+        return None
+
+    try:
+        print("Starting fence activation check...")
+        metrics.new_trace_id()
+        started = time.monotonic()
+        stats = evaluate_shapes(load_shapes(force_full), force=force)
+        print(f"Fence activation check completed in {time.monotonic() - started:.1f}s! {stats}")
+        print(f"WeatherAPI connections: {http_stats()}")
+        record_pass("sweep", started, stats)
+        return stats
     except Exception as e:
         print(f"Error in fence_activation: {str(e)}")
+        return None
+    finally:
+        pass_lock.release()
 
 
-if __name__ == '__main__':
-    print("Worker started - Running fence activation every hour (TESTING MODE)")
+def reconcile(force=False):
+    """
+    Backstop sweep in watch mode: reread every shape. Only cells due on the
+    adaptive schedule are refreshed unless force is set (startup, lost
+    change stream history), so quiet cells still back off to the maximum.
+    """
+    return fence_activation(force_full=True, force=force)
+
+
+def activate_changed(inserted_or_updated, deleted=()):
+    """Evaluate only the shapes that changed; waits for a running sweep to finish"""
+    with pass_lock:
+        for shape_id in deleted:
+            shape_catalog.pop(shape_id, None)
+        if not inserted_or_updated:
+            return None
+        try:
+            metrics.new_trace_id()
+            started = time.monotonic()
+            documents = list(drawn_shapes.aggregate(shape_pipeline(ids=inserted_or_updated)))
+            for document in documents:
+                shape_catalog[document['_id']] = document
+            stats = evaluate_shapes(documents, force=True)
+            print(f"Evaluated {len(documents)} changed shape(s) in {time.monotonic() - started:.1f}s! {stats}")
+            record_pass("changes", started, stats)
+            return stats
+        except Exception as e:
+            print(f"Error evaluating changed shapes: {str(e)}")
+            return None
+
+
+def watch_changes():
+    """
+    Follow the shapes change stream, evaluating changed shapes in small batches.
+    Returns False if the server doesn't support change streams.
+    """
+    resume_token = None
+    while True:
+        try:
+            with drawn_shapes.watch(SHAPE_CHANGES, resume_after=resume_token, max_await_time_ms=1000) as stream:
+                print("Watching shapes for changes")
+                changed, deleted = set(), set()
+                deadline = None
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        shape_id = change['documentKey']['_id']
+                        if change['operationType'] == 'delete':
+                            deleted.add(shape_id)
+                            changed.discard(shape_id)
+                        else:
+                            changed.add(shape_id)
+                        if deadline is None:
+                            deadline = time.monotonic() + WORKER_CHANGE_WINDOW
+                    # Flush once the stream goes quiet or the window has passed
+                    if deadline is not None and (change is None or time.monotonic() >= deadline):
+                        activate_changed(changed, deleted)
+                        changed, deleted = set(), set()
+                        deadline = None
+                    resume_token = stream.resume_token
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                print(f"Change streams unavailable ({e}), polling instead")
+                return False
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                # Changes were missed while disconnected: start over with a full sweep
+                print("Change stream history lost, reconciling all shapes")
+                resume_token = None
+                reconcile(force=True)
+            else:
+                print(f"Change stream failed: {str(e)}")
+                time.sleep(WORKER_POLL_SECONDS)
+        except PyMongoError as e:
+            print(f"Change stream failed: {str(e)}")
+            time.sleep(WORKER_POLL_SECONDS)
+
+
+def poll_changes():
+    """
+    Fallback for servers without change streams: poll for shapes with a newer
+    _id (inserts) or modified_at (geometry edits, when writers set it).
+    Deletions are picked up by the reconciliation sweep.
+    """
+    print(f"Polling shapes for changes every {WORKER_POLL_SECONDS:g}s")
+    last_id = None
+    # Small overlap for writers whose clocks run behind ours
+    last_modified = datetime.now(timezone.utc) - timedelta(minutes=1)
+    while True:
+        try:
+            if last_id is None:
+                newest = drawn_shapes.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+                last_id = newest['_id'] if newest else None
+            query = {'modified_at': {'$gt': last_modified}}
+            if last_id is not None:
+                query = {'$or': [{'_id': {'$gt': last_id}}, query]}
+            documents = list(drawn_shapes.find(query, {'_id': 1, 'modified_at': 1}))
+            if documents:
+                ids = [document['_id'] for document in documents]
+                last_id = max(ids + ([last_id] if last_id is not None else []))
+                modified = [document['modified_at'] for document in documents
+                            if isinstance(document.get('modified_at'), datetime)]
+                if modified:
+                    last_modified = max(modified)
+                activate_changed({document['_id'] for document in documents})
+        except Exception as e:
+            print(f"Error polling shapes: {str(e)}")
+        time.sleep(WORKER_POLL_SECONDS)
+
 
-    schedule.every(1).minute.do(fence_activation)
+def follow_shape_changes():
+    if not watch_changes():
+        poll_changes()
 
-    # Run immediately on startup
-    # fence_activation()
+
+def run_threaded(job):
+    """Run a scheduled job off the scheduler thread; the job guards its own overlap"""
+    Thread(target=job, daemon=True).start()
+
+
+if __name__ == '__main__':
+    if WORKER_MODE == "schedule":
+        print("Worker started - Running fence activation every minute")
+        schedule.every(1).minute.do(run_threaded, fence_activation)
+    else:
+        print(f"Worker started - Watching shape changes, reconciling every {WORKER_RECONCILE_MINUTES:g} minute(s)")
+        Thread(target=follow_shape_changes, name="shape-changes", daemon=True).start()
+        # Refresh the cells that are due; the reconcile also rereads every shape (still only due cells)
+        schedule.every(WORKER_REFRESH_MIN_MINUTES).minutes.do(run_threaded, fence_activation)
+        schedule.every(WORKER_RECONCILE_MINUTES).minutes.do(run_threaded, reconcile)
+        # Evaluate everything once, covering changes made while the worker was down
+        run_threaded(lambda: reconcile(force=True))
 
     # Keep the worker running
     while True: